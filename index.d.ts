@@ -15,7 +15,7 @@ export type TokenList = {
   version: Version;
 };
 
-type Token = {
+export type Token = {
   address: string;
   chainId: string;
   decimals: number;
@@ -25,10 +25,60 @@ type Token = {
   extensions?: Record<string, any>;
 };
 
+export type ManifestFile = {
+  file: string;
+  bytes: number;
+  sha256: string;
+  tokens: number;
+};
+
+export type Manifest = {
+  // precompressed variants next to every file on the CDN, e.g.
+  // `evm.all.json.gz`; the npm package leaves them out
+  encodings: ("gzip" | "br")[];
+  lists: Record<string, ManifestFile & {
+    // sha256 of the minified `tokens` array, timestamp and version excluded
+    content_sha256: string;
+    chains: Record<string, ManifestFile>;
+    // address and prefix-search indexes over `tokens` of the list
+    index: Omit<ManifestFile, "tokens">;
+    // patch from the previous release, absent when nothing changed
+    delta?: Omit<ManifestFile, "tokens"> & {
+      base: string;
+      added: number;
+      removed: number;
+      changed: number;
+    };
+  }>;
+};
+
+// contents of `deltas/{impl}/{base sha256}.json`
+export type TokenListDelta = {
+  impl: string;
+  base: { sha256: string; version: Version; timestamp: string };
+  target: { sha256: string; version: Version; timestamp: string };
+  added: Token[];
+  removed: Pick<Token, "chainId" | "address">[];
+  // full new entries of tokens whose fields changed
+  changed: Token[];
+};
+
 export const version: {
   version: string;
 };
 
+export const manifest: Manifest;
+
+// the list of a single chain, e.g. chainTokenList("evm", "56"); only that
+// chain's file is loaded
+export function chainTokenList(impl: string, chainId: string | number): TokenList | undefined;
+
+// O(1) lookup; hex addresses match case-insensitively
+export function findToken(impl: string, chainId: string | number, address: string): Token | undefined;
+
+// tokens whose symbol, name or a word of the name starts with `query`
+export function searchTokens(impl: string, query: string, limit?: number): Token[];
+
 export const evmAllTokenList: TokenList;
 export const solAllTokenList: TokenList;
 export const algoAllTokenList: TokenList;
@@ -0,0 +1,272 @@
+'''derived files written next to the `build/{impl}.all.json` token lists
+
+    {impl}.all.json[.gz|.br]        the list, minified, plus compressed copies
+    chains/{impl}--{chainId}.json   one list per chainId, same layout
+    {impl}.all.index.json           lookup indexes into the list's tokens
+    deltas/{impl}/{sha256}.json     patch from the previous release, named
+                                    after that release's content hash
+    manifest.json                   files, sizes, digests and token counts
+
+Brotli copies are only written when the `brotli` package is installed.
+'''
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from token_store import normalize_address
+
+
+CHAINS_DIR = "chains"
+DELTAS_DIR = "deltas"
+# lists of the release being replaced, kept by `snapshot_previous`
+PREVIOUS_DIR = "./.cache/previous_build"
+
+
+def dump_list(list):
+    '''token list as minified, key-sorted json'''
+    return json.dumps(list, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def write_atomic(path, content, fsync=False):
+    '''replace `path` with `content` (str or bytes) so readers never see it half written'''
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    # per thread, so concurrent writers of one path don't share a temp file
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_if_changed(path, content):
+    '''write `content` (str or bytes) unless the file already holds it; True if written'''
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    write_atomic(path, data)
+    return True
+
+
+def list_timestamp():
+    return datetime.utcnow().isoformat()[:-3] + "Z"
+
+
+def list_version(version):
+    '''`x.y.z` as the version object of a token list'''
+    major, minor, patch = (int(p) for p in version.split("."))
+    return dict(major=major, minor=minor, patch=patch)
+
+
+def version_key(version):
+    return tuple((version or {}).get(k, 0) for k in ("major", "minor", "patch"))
+
+
+def encodings():
+    return ["gzip", "br"] if brotli is not None else ["gzip"]
+
+
+def write_compressed(path, data):
+    '''write `path` and its precompressed variants, returning its manifest entry'''
+    write_if_changed(path, data)
+    # mtime=0 keeps the gzip bytes stable, so unchanged lists are not rewritten
+    write_if_changed(f"{path}.gz", gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        write_if_changed(f"{path}.br", brotli.compress(data))
+    elif os.path.exists(f"{path}.br"):
+        os.remove(f"{path}.br")
+    return dict(bytes=len(data), sha256=hashlib.sha256(data).hexdigest())
+
+
+def normalize_text(text):
+    '''search key: NFKC, lower case, single spaces; mirrored in index.js'''
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def build_lookup_index(tokens):
+    '''address and search indexes over the positions of `tokens`
+
+    `addresses` maps chainId -> normalized address -> position. `search` is
+    a sorted array of [key, position] over symbols, names and name words,
+    so a prefix query is a binary search plus a scan of the matches. Keys
+    are ordered by utf-16 code units, the order javascript compares in.
+    '''
+    addresses = {}
+    search = set()
+    for position, token in enumerate(tokens):
+        addresses.setdefault(str(token.get("chainId")), {})[
+            normalize_address(token.get("address", ""))] = position
+        symbol = normalize_text(token.get("symbol"))
+        name = normalize_text(token.get("name"))
+        for key in [symbol, name] + name.split(" "):
+            if key:
+                search.add((key, position))
+    return dict(
+        addresses=addresses,
+        search=[list(entry) for entry in sorted(
+            search, key=lambda entry: (entry[0].encode("utf-16-be"), entry[1]))],
+    )
+
+
+def content_hash(tokens):
+    '''sha256 of the tokens alone, so timestamps and versions don't count'''
+    return hashlib.sha256(dump_list(tokens).encode("utf-8")).hexdigest()
+
+
+def token_key(token):
+    return f'{token.get("chainId")}--{normalize_address(token.get("address", ""))}'
+
+
+def diff_tokens(previous, current):
+    '''(added, removed, changed) between two token arrays, keyed by chainId+address'''
+    before = dict((token_key(t), t) for t in previous)
+    after = dict((token_key(t), t) for t in current)
+    added = [t for k, t in after.items() if k not in before]
+    removed = [dict(chainId=t.get("chainId"), address=t.get("address"))
+               for k, t in before.items() if k not in after]
+    changed = [t for k, t in after.items()
+               if k in before and before[k] != t]
+    return added, removed, changed
+
+
+def snapshot_previous(dir, source=None, previous_dir=PREVIOUS_DIR):
+    '''keep the lists of the release about to be replaced
+
+    `source` is the build dir of that release and defaults to `dir`, which
+    is what a local rebuild replaces; CI can point it at the unpacked
+    previous npm package instead.
+    '''
+    source = source or dir
+    if os.path.exists(previous_dir):
+        shutil.rmtree(previous_dir)
+    os.makedirs(previous_dir)
+    if not os.path.isdir(source):
+        return
+    for f in os.listdir(source):
+        if f.endswith(".all.json"):
+            shutil.copyfile(os.path.join(source, f),
+                            os.path.join(previous_dir, f))
+
+
+def load_previous(name, previous_dir):
+    try:
+        with open(os.path.join(previous_dir, f"{name}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_delta(dir, impl, previous, list):
+    '''write the patch from `previous` to `list`, returning its manifest entry'''
+    added, removed, changed = diff_tokens(
+        previous.get("tokens", []), list.get("tokens", []))
+    previous_hash = content_hash(previous.get("tokens", []))
+    delta = dict(
+        impl=impl,
+        base=dict(sha256=previous_hash, version=previous.get("version"),
+                  timestamp=previous.get("timestamp")),
+        target=dict(sha256=content_hash(list.get("tokens", [])),
+                    version=list.get("version"), timestamp=list.get("timestamp")),
+        added=added,
+        removed=removed,
+        changed=changed,
+    )
+    file = f"{DELTAS_DIR}/{impl}/{previous_hash}.json"
+    os.makedirs(os.path.join(dir, DELTAS_DIR, impl), exist_ok=True)
+    entry = write_compressed(os.path.join(dir, file),
+                             dump_list(delta).encode("utf-8"))
+    entry.update(file=file, base=previous_hash, added=len(added),
+                 removed=len(removed), changed=len(changed))
+    return entry
+
+
+def write_artifacts(dir, impls, previous_dir=PREVIOUS_DIR, lists=None, version=None):
+    '''(re)write minified lists, per-chain shards, deltas and the manifest
+
+    `impls` are the list names in `dir`, like `evm.all`; their contents come
+    from `lists` when given, else from the files already there. A list whose tokens
+    match the previous release keeps that release's timestamp and version;
+    otherwise a delta from it is written, and a list still carrying that
+    release's timestamp (kept by an earlier pass, then changed by
+    check_fix) gets a fresh one and the release `version`, `x.y.z`. Shards
+    and deltas that no longer belong to a list are removed.
+    '''
+    chains_dir = os.path.join(dir, CHAINS_DIR)
+    os.makedirs(chains_dir, exist_ok=True)
+    manifest = dict(encodings=encodings(), lists={})
+    shards = set()
+    deltas = set()
+    for name in impls:
+        if lists is not None:
+            list = lists[name]
+        else:
+            with open(os.path.join(dir, f"{name}.json")) as f:
+                list = json.load(f)
+        impl = name.split(".")[0]
+        previous = load_previous(name, previous_dir)
+        if previous is not None and previous.get("tokens") == list.get("tokens"):
+            # nothing to publish: don't make clients think there is
+            list["timestamp"] = previous.get("timestamp")
+            list["version"] = previous.get("version")
+            previous = None
+        elif previous is not None and list.get("timestamp") == previous.get("timestamp"):
+            list["timestamp"] = list_timestamp()
+            if version is not None:
+                list["version"] = list_version(version)
+        if previous is not None and version_key(list.get("version")) <= version_key(
+                previous.get("version")):
+            print(f"warning: {name} changed but its version is not above the "
+                  f"previous release's {previous.get('version')}")
+        entry = write_compressed(os.path.join(dir, f"{name}.json"),
+                                 dump_list(list).encode("utf-8"))
+        entry.update(file=f"{name}.json", tokens=len(list.get("tokens", [])),
+                     content_sha256=content_hash(list.get("tokens", [])), chains={})
+        if previous is not None:
+            entry["delta"] = write_delta(dir, impl, previous, list)
+            deltas.add(entry["delta"]["file"])
+        index = build_lookup_index(list.get("tokens", []))
+        entry["index"] = write_compressed(
+            os.path.join(dir, f"{name}.index.json"),
+            json.dumps(index, sort_keys=True, separators=(",", ":"),
+                       ensure_ascii=False).encode("utf-8"))
+        entry["index"].update(file=f"{name}.index.json")
+
+        chains = {}
+        for token in list.get("tokens", []):
+            chains.setdefault(str(token.get("chainId")), []).append(token)
+        for chain_id, tokens in sorted(chains.items()):
+            file = f"{CHAINS_DIR}/{impl}--{chain_id}.json"
+            shards.add(os.path.basename(file))
+            chain_entry = write_compressed(
+                os.path.join(dir, file),
+                dump_list(dict(list, tokens=tokens)).encode("utf-8"))
+            chain_entry.update(file=file, tokens=len(tokens))
+            entry["chains"][chain_id] = chain_entry
+        manifest["lists"][impl] = entry
+
+    for f in os.listdir(chains_dir):
+        if f.split(".json")[0] + ".json" not in shards:
+            os.remove(os.path.join(chains_dir, f))
+    for root, _, files in os.walk(os.path.join(dir, DELTAS_DIR)):
+        for f in files:
+            file = os.path.relpath(os.path.join(root, f), dir).replace(os.sep, "/")
+            if file.split(".json")[0] + ".json" not in deltas:
+                os.remove(os.path.join(root, f))
+    write_if_changed(os.path.join(dir, "manifest.json"),
+                     json.dumps(manifest, sort_keys=True, indent=2))
+    return manifest
@@ -0,0 +1,365 @@
+'''benchmark the build and check pipelines against local stub servers
+
+Starts stub Coingecko, token-list and JSON-RPC servers on localhost, lays
+out a throwaway workspace with one evm network, and times each stage:
+
+    fetch_tokens   TokenProcesser.fetch_tokens (coins list, markets, lists)
+    merge          TokenStore ingest of the local, third-party and cg sources
+    build_list     build() writing ./build
+    check_tokens   check_tokens over the built evm list
+
+For every stage it reports wall time, requests and bytes served by the
+stubs, bytes written to the workspace and peak python heap (tracemalloc);
+check_tokens also reports how many tokens came out ok, invalid or error.
+
+    python3 script/bench.py --tokens 1000 --latency 0.005
+    python3 script/bench.py --tokens 100000 --no-memory --report bench.json
+'''
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from build_list import TokenProcesser, build
+from check_fix import check_tokens, load_networks
+from http_cache import HttpCache
+from journal import JournaledDict
+from ratelimit import RateLimiter
+from token_store import TokenStore
+from verify_cache import ERROR, INVALID, OK, VerificationCache
+
+
+PLATFORM = "ethereum"
+CHAIN_ID = "1"
+
+
+def address(i):
+    return "0x%040x" % i
+
+
+def abi_string(value):
+    data = value.encode()
+    return "0x" + (32).to_bytes(32, "big").hex() + len(data).to_bytes(32, "big").hex() + \
+        data.ljust((len(data) + 31) // 32 * 32 or 32, b"\0").hex()
+
+
+class StubServer(object):
+    '''threaded http server that counts the requests it answers and bytes sent'''
+
+    def __init__(self, handle, latency=0.0):
+        self.handle = handle
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # headers and body go out in separate writes; without this
+                # nagle + delayed acks add ~40ms to every keep-alive reply
+                self.connection.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                with stub.lock:
+                    stub.requests += 1
+                    stub.bytes += len(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+                status, body = stub.handle("GET", url.path, query, None)
+                self.reply(status, body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                status, body = stub.handle("POST", self.path, {}, payload)
+                self.reply(status, body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def counters(self):
+        with self.lock:
+            return self.requests, self.bytes
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Dataset(object):
+    '''synthetic tokens shared by the stubs
+
+    `size` coins exist on the platform; the third-party list repeats half
+    of them and adds as many new ones; every `invalid_every`-th address is
+    not a contract.
+    '''
+
+    def __init__(self, size, invalid_every=10):
+        self.size = size
+        self.invalid_every = invalid_every
+
+    def coins(self):
+        return [
+            dict(id=f"coin-{i}", symbol=f"c{i}", name=f"Coin {i}",
+                 platforms={PLATFORM: address(i)})
+            for i in range(1, self.size + 1)
+        ]
+
+    def token_list(self):
+        start = self.size // 2
+        return dict(name="stub", tokens=[
+            dict(chainId=int(CHAIN_ID), address=address(i), symbol=f"T{i}",
+                 name=f"Token {i}", decimals=18,
+                 logoURI=f"https://example.com/{i}.png")
+            for i in range(start, start + self.size)
+        ])
+
+    def is_contract(self, addr):
+        return int(addr, 16) % self.invalid_every != 0
+
+    def coingecko(self, method, path, query, payload):
+        if path.endswith("/coins/list"):
+            return 200, self.coins()
+        if path.endswith("/coins/markets"):
+            return 200, [
+                dict(id=id, market_cap=int(id.split("-")[1]) * 1000,
+                     image=f"https://example.com/{id}.png")
+                for id in query.get("ids", "").split(",") if id
+            ]
+        if path == "/list.json":
+            return 200, self.token_list()
+        return 404, None
+
+    def rpc(self, method, path, query, payload):
+        calls = payload if isinstance(payload, list) else [payload]
+        results = []
+        for call in calls:
+            # like a node: no code, and empty call results, at a plain address
+            result = "0x"
+            if call["method"] == "eth_blockNumber":
+                result = "0x100"
+            elif call["method"] == "eth_getCode":
+                if self.is_contract(call["params"][0]):
+                    result = "0x6080"
+            elif call["method"] == "eth_call" and self.is_contract(call["params"][0]["to"]):
+                to = call["params"][0]["to"]
+                i = int(to, 16)
+                result = {
+                    "0x06fdde03": abi_string(f"Token {i}"),
+                    "0x95d89b41": abi_string(f"T{i}"),
+                    "0x313ce567": "0x12",
+                }.get(call["params"][0]["data"], "0x")
+            results.append(dict(jsonrpc="2.0", id=call.get("id"), result=result))
+        return 200, results if isinstance(payload, list) else results[0]
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Bench(object):
+
+    def __init__(self, workspace, servers, memory=True, verbose=False):
+        self.workspace = workspace
+        self.servers = servers
+        self.memory = memory
+        self.verbose = verbose
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        before = dict((k, s.counters()) for k, s in self.servers.items())
+        written = dir_size(self.workspace)
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        # filled in by the stage, e.g. with verification outcomes
+        extra = {}
+        if self.verbose:
+            yield extra
+        else:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                yield extra
+        elapsed = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        requests_ = {}
+        for k, s in self.servers.items():
+            r, b = s.counters()
+            requests_[k] = dict(requests=r - before[k][0],
+                                bytes=b - before[k][1])
+        result = dict(
+            stage=name,
+            seconds=round(elapsed, 4),
+            servers=requests_,
+            bytes_written=dir_size(self.workspace) - written,
+            peak_memory=peak,
+            **extra
+        )
+        self.stages.append(result)
+        print(f"{name:<14} {elapsed:9.3f}s  " + "  ".join(
+            f"{k}={v['requests']}req/{v['bytes']}B" for k, v in requests_.items()) +
+            f"  written={result['bytes_written']}B" +
+            (f"  peak={peak / (1 << 20):.1f}MiB" if peak is not None else "") +
+            "".join(f"  {k}={v}" for k, v in extra.get("outcomes", {}).items()))
+
+
+def prepare_workspace(workspace, cg_url, rpc_url, rpc_rate):
+    network_dir = os.path.join(workspace, "tokens", "eth")
+    os.makedirs(network_dir)
+    chain = {
+        "id": f"evm--{CHAIN_ID}",
+        "impl": "evm",
+        "chainId": CHAIN_ID,
+        "name": "Stub Ethereum",
+        "rpcURLs": [{"url": rpc_url, "rate": rpc_rate, "burst": rpc_rate, "concurrency": 4}],
+        "coingecko": {"platform": PLATFORM},
+        "token_source": [{"source": "stub", "url": f"{cg_url}/list.json", "path": "tokens"}],
+    }
+    with open(os.path.join(network_dir, "chain.json"), "w") as f:
+        json.dump(chain, f)
+    with open(os.path.join(network_dir, "tokens.json"), "w") as f:
+        json.dump([dict(address=address(1), decimals=18, name="Local", symbol="LOCAL")], f)
+    with open(os.path.join(workspace, "package.json"), "w") as f:
+        json.dump({"version": "0.0.1"}, f)
+
+
+def run(args):
+    dataset = Dataset(args.tokens)
+    servers = dict(
+        coingecko=StubServer(dataset.coingecko, args.latency),
+        rpc=StubServer(dataset.rpc, args.latency),
+    )
+    workspace = tempfile.mkdtemp(prefix="token-list-bench-")
+    cwd = os.getcwd()
+    try:
+        prepare_workspace(workspace, servers["coingecko"].url,
+                          servers["rpc"].url, args.rpc_rate)
+        os.chdir(workspace)
+        bench = Bench(workspace, servers, memory=not args.no_memory,
+                      verbose=args.verbose)
+
+        with bench.stage("fetch_tokens"):
+            p = TokenProcesser("./tokens", HttpCache("./.cache/http"))
+            p.coingecko.base = servers["coingecko"].url + "/api/v3"
+            p.coingecko.limiter = RateLimiter(
+                rate=args.coingecko_rate, burst=args.coingecko_rate, concurrency=8)
+            network_tokens = p.fetch_tokens()
+            impl_list = p.merge_list_by_impl(network_tokens)
+
+        sources = [
+            ([dict(t, chainId=CHAIN_ID, extensions=dict(source=["onekey"]))
+              for t in dataset.token_list()["tokens"][:1000]], 1),
+            ([dict(t, chainId=CHAIN_ID, extensions=dict(source=["stub"]))
+              for t in dataset.token_list()["tokens"]], 2),
+            ([dict(address=c["platforms"][PLATFORM], symbol=c["symbol"], name=c["name"],
+                   chainId=CHAIN_ID, extensions=dict(source=["coingecko"]))
+              for c in dataset.coins()], 0),
+        ]
+        with bench.stage("merge"):
+            store = TokenStore()
+            for tokens, priority in sources:
+                store.extend(f"evm--{CHAIN_ID}", tokens, priority)
+            store.tokens(f"evm--{CHAIN_ID}")
+
+        with bench.stage("build_list"):
+            build(version="0.0.1", impl_list=impl_list)
+
+        with open("./build/evm.all.json") as f:
+            tokens = json.load(f)["tokens"]
+        with bench.stage("check_tokens") as extra:
+            networks = load_networks("./tokens")
+            with JournaledDict("./token_info.json") as token_info, \
+                    VerificationCache("./.cache/verify_cache.json") as verify_cache:
+                check_tokens("evm", networks, tokens,
+                             token_info, verify_cache)
+                outcomes = dict((status, 0) for status in (OK, INVALID, ERROR))
+                for entry in verify_cache.entries.values():
+                    outcomes[entry["status"]] += 1
+                extra["outcomes"] = outcomes
+
+        report = dict(
+            tokens=args.tokens,
+            latency=args.latency,
+            python=sys.version.split()[0],
+            stages=bench.stages,
+        )
+        if args.report:
+            with open(os.path.join(cwd, args.report), "w") as f:
+                f.write(json.dumps(report, indent=2))
+                f.write("\n")
+        return report
+    finally:
+        os.chdir(cwd)
+        for s in servers.values():
+            s.close()
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+        else:
+            print(f"workspace kept at {workspace}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark build_list.py and check_fix.py against local stubs")
+    parser.add_argument("--tokens", type=int, default=1000,
+                        help="coins on the stub platform (1k-500k)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds every stub response is delayed")
+    parser.add_argument("--coingecko-rate", type=float, default=1000,
+                        help="coingecko calls per second allowed")
+    parser.add_argument("--rpc-rate", type=float, default=1000,
+                        help="rpc calls per second allowed")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which slows large runs")
+    parser.add_argument("--report", default=None,
+                        help="write the json report to this file")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary workspace")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the pipelines' own output")
+    run(parser.parse_args())
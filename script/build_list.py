@@ -1,13 +1,28 @@
 import os
 from pathlib import Path
-from re import T
-import sys
+import argparse
+import hashlib
 import json
-import time
-import yaml
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import shutil
-import requests
+
+from artifacts import (list_timestamp, list_version, snapshot_previous, write_artifacts,
+                       write_atomic, write_if_changed)
+from check_fix import verify_impl_list
+from checkpoint import Checkpoints
+from http_cache import HttpCache
+from json_stream import iter_items
+from logo_check import LogoValidator, validate_logos
+from metrics import metrics
+from ratelimit import RateLimiter
+from spam import filter_spam
+from token_store import TokenStore
+
+
+# when several sources list the same token, the lowest value wins its fields
+COINGECKO_PRIORITY = 0
+LOCAL_PRIORITY = 1
+THIRD_PARTY_PRIORITY = 2
 
 
 class Coingecko():
@@ -17,10 +32,32 @@ class Coingecko():
 
     coin_cache = {}
 
+    def __init__(self, http=None, limiter=None, checkpoints=None):
+        self.http = http or HttpCache()
+        # resumable progress of the current run, see checkpoint.Checkpoints
+        self.checkpoints = checkpoints
+        # shared by every network fetched in parallel; one call per 1.5s
+        # keeps the public api from rate limiting us
+        self.limiter = limiter or RateLimiter(rate=1 / 1.5)
+        # digest of the last coins/list snapshot, see `get_all_coins`
+        self.coins_version = ""
+
     def get_all_coins(self):
         '''get all coins'''
-        data = requests.get(
-            f'{self.base}/coins/list?include_platform=true').json()
+        content = None
+        if self.checkpoints is not None:
+            # a resumed run keeps the snapshot its pages were fetched for
+            content = self.checkpoints.coins_list()
+        if content is None:
+            with metrics.timer("coingecko.coins_list"):
+                resp = self.http.get(
+                    f'{self.base}/coins/list', params={"include_platform": "true"},
+                    kind="coins_list", limiter=self.limiter)
+                content = resp.content
+            if self.checkpoints is not None:
+                self.checkpoints.save_coins_list(content)
+        self.coins_version = hashlib.sha256(content).hexdigest()
+        data = json.loads(content)
 
         platform_coins = {}
         id_coins = {}
@@ -53,42 +90,43 @@ class Coingecko():
         step = 100
         for i in range(0, len(req_ids), step):
             end = i + step
-            data = requests.get(
-                f'{self.base}/coins/markets',
-                params={"vs_currency": "usd", "ids": ",".join(
-                    req_ids[i:end]), "order": "market_cap_desc", "sparkline": "false"}
-            ).json()
-            for item in data:
+            page_ids = ",".join(req_ids[i:end])
+            page_key = hashlib.sha256(page_ids.encode()).hexdigest()
+            items = None
+            if self.checkpoints is not None:
+                items = self.checkpoints.page(page_key)
+            if items is None:
+                with metrics.timer("coingecko.markets"):
+                    resp = self.http.get(
+                        f'{self.base}/coins/markets',
+                        params={"vs_currency": "usd", "ids": page_ids,
+                                "order": "market_cap_desc", "sparkline": "false"},
+                        kind="markets", limiter=self.limiter)
+                items = resp.json()
+                if self.checkpoints is not None:
+                    self.checkpoints.markets[page_key] = items
+            for item in items:
                 coins[item["id"]] = item
                 self.coin_cache[item["id"]] = item
-            time.sleep(1.5)
 
         return coins
 
-    def topk_by_market_cap(self, network, tokens, k):
-        # get coingecko platform id
+    def topk_by_market_cap(self, network, tokens, k, market_caps):
+        '''move the k tokens with the largest market cap to the front
+
+        `market_caps` maps lowercase addresses to the `market_cap` that
+        `/coins/markets` returned in `get_info_by_ids`, so ranking needs no
+        further requests.
+        '''
         platform_id = network.get("coingecko", {}).get("platform")
         if platform_id is None:
             return tokens
 
         value_map = {}
-        step = 100
-        for i in range(0, len(tokens), step):
-            end = i + step
-            addresses = [t["address"] for t in tokens[i:end]]
-            url = f"https://api.coingecko.com/api/v3/simple/token_price/{platform_id}"
-            data = requests.get(
-                url,
-                params={'contract_addresses': ','.join(
-                    addresses), 'include_market_cap': 'true', 'vs_currencies': 'usd'}
-            ).json()
-            for address in addresses:
-                market_cap = data.get(address, {'usd_market_cap': 0}).get(
-                    'usd_market_cap', 0)
-                if market_cap is not None and market_cap > 0:
-                    value_map[address] = market_cap
-            print(f"get coingecko for {platform_id} {end}")
-            time.sleep(1.5)
+        for token in tokens:
+            market_cap = market_caps.get(token["address"].lower())
+            if market_cap is not None and market_cap > 0:
+                value_map[token["address"]] = market_cap
 
         addresses_with_cap = list(value_map.keys())
         addresses_with_cap.sort(key=lambda a: value_map[a], reverse=True)
@@ -102,10 +140,17 @@ class TokenProcesser():
     '''process tokens'''
     coingecko = Coingecko()
     networks = []
+    # drop third-party tokens that impersonate well-known ones, see spam.py
+    spam_filter = True
 
-    def __init__(self, dir):
+    def __init__(self, dir, http=None, checkpoints=None):
         self.dir = dir
         self.networks = self.list_networks(dir)
+        self.checkpoints = checkpoints
+        if http is not None or checkpoints is not None:
+            self.coingecko = Coingecko(http, checkpoints=checkpoints)
+        self.http = self.coingecko.http
+        self.store = TokenStore()
 
     def list_networks(self, dir):
         '''find all networks'''
@@ -123,118 +168,176 @@ class TokenProcesser():
                 return
             network["code"] = d
             networks.append(network)
+        networks.sort(key=lambda n: n["code"])
         return networks
 
-    def fetch_tokens(self):
-        '''fetch all tokens'''
-        network_tokens = []
+    def fingerprint(self, network, coins_version):
+        '''digest of everything a network's token list is built from'''
+        h = hashlib.sha256()
+        h.update(json.dumps(network, sort_keys=True).encode())
+        try:
+            with open(f"{self.dir}/{network.get('code')}/tokens.json", "rb") as f:
+                h.update(f.read())
+        except OSError:
+            pass
+        for s in network.get("token_source", []):
+            resp = self.http.get(s.get("url"), kind="token_list")
+            digest = hashlib.sha256()
+            with resp.open() as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(chunk)
+            h.update(digest.digest())
+        if network.get("coingecko", {}).get("platform", "") != "":
+            h.update(coins_version.encode())
+        # flags that change the merged tokens
+        h.update(json.dumps(dict(spam_filter=self.spam_filter)).encode())
+        return h.hexdigest()
+
+    def fetch_tokens(self, state=None, workers=None):
+        '''fetch all tokens
+
+        Networks are fetched in parallel on `workers` threads (one per
+        network by default) sharing the rate-limited coingecko client; the
+        result keeps the order of `self.networks`.
+
+        With a `state` dict (see `load_build_state`), networks whose
+        fingerprint is unchanged reuse the tokens recorded there; the state is
+        updated in place for the next run.
+
+        With `checkpoints`, every network's merged tokens are saved as soon
+        as it is done, and networks a failed run already finished are reused
+        while their fingerprint is unchanged.
+        '''
         all_platform_coins, all_coins = self.coingecko.get_all_coins()
 
-        for network in self.networks:
-            cg = network.get("coingecko", {})
-
-            coins = []
-            if cg.get("platform", "") != "":
-                coins = all_platform_coins.get(cg["platform"], [])
-
-            # local list
-            tokens_file = f"{self.dir}/{network.get('code')}/tokens.json"
-            local_tokens = []
-            try:
-                with open(tokens_file) as f:
-                    local_tokens = json.load(f)
-            except Exception:
-                local_tokens = []
+        def fetch(network):
+            fingerprint = None
+            if state is not None or self.checkpoints is not None:
+                fingerprint = self.fingerprint(
+                    network, self.coingecko.coins_version)
+            if state is not None:
+                previous = state.get(network["code"])
+                if previous is not None and previous["fingerprint"] == fingerprint:
+                    print(f"{network['code']} unchanged, reuse previous tokens")
+                    self.store.extend(network["id"], previous["tokens"])
+                    return previous["tokens"], fingerprint
+            if self.checkpoints is not None:
+                tokens = self.checkpoints.network(network["code"], fingerprint)
+                if tokens is not None:
+                    print(f"{network['code']} checkpointed, resume with its tokens")
+                    self.store.extend(network["id"], tokens)
+                    return tokens, fingerprint
+            with metrics.timer(f"fetch.{network['code']}"):
+                tokens = self.fetch_network_tokens(
+                    network, all_platform_coins, all_coins)
+            if self.checkpoints is not None:
+                self.checkpoints.networks[network["code"]] = dict(
+                    fingerprint=fingerprint, tokens=tokens)
+            return tokens, fingerprint
 
-            for token in local_tokens:
-                token["chainId"] = network["chainId"]
-                token["extensions"] = dict(source=["onekey"])
+        network_tokens = []
+        with ThreadPoolExecutor(max_workers=workers or max(len(self.networks), 1)) as executor:
+            results = executor.map(fetch, self.networks)
+            for network, (tokens, fingerprint) in zip(self.networks, results):
+                if state is not None:
+                    state[network["code"]] = dict(
+                        fingerprint=fingerprint, tokens=tokens)
+                network_tokens.append(dict(
+                    network=network,
+                    tokens=tokens,
+                ))
+        return network_tokens
 
-            # other source
-            third_tokens = self.dump_third_token_list(
-                network.get("token_source", []))
+    def fetch_network_tokens(self, network, all_platform_coins, all_coins):
+        '''fetch, merge and rank the tokens of one network'''
+        cg = network.get("coingecko", {})
 
-            tokens = self.merge_tokens(local_tokens, third_tokens)
-            if len(coins) > 0:
-                coins_info = self.coingecko.get_info_by_ids(
-                    [coin["id"] for coin in coins])
+        coins = []
+        if cg.get("platform", "") != "":
+            coins = all_platform_coins.get(cg["platform"], [])
 
-                cg_tokens = []
+        # local list
+        tokens_file = f"{self.dir}/{network.get('code')}/tokens.json"
+        local_tokens = []
+        try:
+            with open(tokens_file) as f:
+                local_tokens = json.load(f)
+        except Exception:
+            local_tokens = []
 
-                for coin in coins:
-                    address = all_coins[coin["id"]
-                                        ]["platforms"][cg["platform"]]
-                    if address is None or address == "":
+        chain = network["id"]
+        for token in local_tokens:
+            token["chainId"] = network["chainId"]
+            token["extensions"] = dict(source=["onekey"])
+        metrics.count_tokens(chain, "local", self.store.extend(
+            chain, local_tokens, LOCAL_PRIORITY))
+
+        # other source
+        metrics.count_tokens(chain, "third_party", self.store.extend(
+            chain, self.dump_third_token_list(
+                network.get("token_source", []), network["chainId"]),
+            THIRD_PARTY_PRIORITY))
+
+        market_caps = {}
+        if len(coins) > 0:
+            # one /coins/markets sweep gives both the logo and the market cap
+            coins_info = self.coingecko.get_info_by_ids(
+                [coin["id"] for coin in coins])
+
+            cg_count = 0
+            for coin in coins:
+                address = all_coins[coin["id"]
+                                    ]["platforms"][cg["platform"]]
+                if address is None or address == "":
+                    continue
+                token = dict(
+                    extensions=dict(source=["coingecko"]),
+                    chainId=network["chainId"],
+                    symbol=coin.get("symbol"),
+                    name=coin.get("name"),
+                    address=all_coins[coin["id"]
+                                      ]["platforms"][cg["platform"]]
+                )
+                info = coins_info.get(coin["id"])
+                if info is not None:
+                    token["logoURI"] = info.get("image")
+                    market_caps[address.lower()] = info.get("market_cap")
+                self.store.upsert(chain, token, COINGECKO_PRIORITY)
+                cg_count += 1
+            metrics.count_tokens(chain, "coingecko", cg_count)
+
+        tokens = self.store.tokens(chain)
+        metrics.count_tokens(chain, "merged", len(tokens))
+        if self.spam_filter:
+            # before ranking and verification, so copycats cost no rpc calls
+            tokens = filter_spam(chain, tokens, market_caps)
+        return self.coingecko.topk_by_market_cap(network, tokens, 100, market_caps)
+
+    def dump_third_token_list(self, sources, chain_id):
+        '''yield the tokens of `chain_id` from third-party token lists
+
+        Lists are streamed from the http cache one entry at a time, starting
+        at the source's `path` key (empty for a bare array).
+        '''
+        for s in sources:
+            resp = self.http.get(s.get("url"), kind="token_list")
+            with resp.open() as f:
+                for token in iter_items(f, s.get("path", "")):
+                    if str(token.get("chainId")) != str(chain_id):
                         continue
-                    token = dict(
-                        extensions=dict(source=["coingecko"]),
-                        chainId=network["chainId"],
-                        symbol=coin.get("symbol"),
-                        name=coin.get("name"),
-                        address=all_coins[coin["id"]
-                                          ]["platforms"][cg["platform"]]
+                    if not token.get("address"):
+                        continue
+                    t = dict(
+                        chainId=chain_id,
+                        symbol=token.get("symbol"),
+                        name=token.get("name"),
+                        decimals=token.get("decimals"),
+                        extensions=dict(source=[s.get("source")]),
+                        address=token["address"],
                     )
-                    if coins_info[coin["id"]] is not None:
-                        token["logoURI"] = coins_info[coin["id"]].get("image")
-                    cg_tokens.append(token)
-
-                tokens = self.merge_tokens(cg_tokens, tokens)
-
-            network_tokens.append(dict(
-                network=network,
-                tokens=self.coingecko.topk_by_market_cap(network, tokens, 100),
-            ))
-        return network_tokens
-
-    def dump_third_token_list(self, sources):
-        ''''''
-        all_tokens = []
-        for s in sources:
-            data = requests.get(s.get("url")).json()
-            tokens = []
-            if s.get("path", "") == "":
-                tokens = data
-            for token in tokens:
-                t = dict(
-                    chainId=token["chainId"],
-                    symbol=token["symbol"],
-                    name=token["name"],
-                    decimals=token["decimals"],
-                    extensions=dict(source=[s.get("source")]),
-                    address=token["address"],
-                )
-                if token.get("logoURI", "") != "":
-                    t["logoURI"] = token["logoURI"]
-                all_tokens.append(t)
-        return all_tokens
-
-    def merge_tokens(self, tokens1, tokens2):
-        if len(tokens2) == 0:
-            return tokens1
-        tokens = []
-        dup = {}
-        for token in tokens1:
-            tokens.append(token)
-            print(token)
-            dup[token["address"].lower()] = token
-        for token in tokens2:
-            if not token["address"]:  # No address
-                continue
-
-            if token["address"].lower() in dup:
-                # merge field
-                t1 = dup[token["address"].lower()]
-                source = t1.get("extensions", {}).get(
-                    "source", [])+token.get("extensions", {}).get("source", [])
-                source = list(set(source))
-                extensions = t1.get("extensions", {})
-                extensions["source"] = source
-                t1["extensions"] = extensions
-                continue
-
-            tokens.append(token)
-            dup[token["address"].lower()] = token
-        return tokens
+                    if token.get("logoURI", "") != "":
+                        t["logoURI"] = token["logoURI"]
+                    yield t
 
     def merge_list_by_impl(self, network_tokens):
         impl_list = {}
@@ -256,13 +359,29 @@ class TokenProcesser():
         return impl_list
 
 
-def build(version="", impl_list=None):
+def load_build_state(path):
+    '''per-network fingerprints and tokens of the previous incremental build'''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_state(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_atomic(path, json.dumps(state, sort_keys=True))
+
+
+def build(version="", impl_list=None, incremental=False, previous=None):
 
     dir = "./build"
+    # deltas are made against the lists this build replaces
+    snapshot_previous(dir, previous)
     try:
-        if os.path.exists(dir):
+        if os.path.exists(dir) and not incremental:
             shutil.rmtree(dir)
-        os.mkdir(dir)
+        os.makedirs(dir, exist_ok=True)
     except OSError as e:
         print("Error: %s - %s." % (e.filename, e.strerror))
 
@@ -274,43 +393,44 @@ def build(version="", impl_list=None):
         except Exception as e:
             print(e)
 
-    files = []
+    lists = build_list(impl_list, version, ".all")
+    files = sorted(lists)
 
-    files += build_list(impl_list, version, ".all")
+    if incremental:
+        # drop lists of impls that no longer have tokens
+        for f in os.listdir(dir):
+            name = f.split(".json")[0]
+            if name.endswith(".index"):
+                name = name[:-len(".index")]
+            if name.endswith(".all") and name not in files:
+                os.remove(os.path.join(dir, f))
 
+    # each list is serialized once, straight from memory
+    write_artifacts(dir, files, lists=lists, version=version)
     build_index(files)
-    with open("./build/version.json", "w") as f:
-        f.write(json.dumps({"version": version}, sort_keys=True, indent=4))
+    write_if_changed("./build/version.json",
+                     json.dumps({"version": version}, sort_keys=True, indent=4))
 
     update_version(version)
 
 
 def build_list(impl_list, version, owner=""):
-    parsed = version.split(".")
-
-    files = []
+    '''token lists keyed by their file name, `{impl}{owner}`'''
+    lists = {}
     for impl, tokens in impl_list.items():
         if len(tokens) == 0:
             continue
 
-        list = {
+        lists[f"{impl}{owner}"] = {
             "name": "OneKey Token List",
-            "timestamp": datetime.utcnow().isoformat()[:-3] + "Z",
-            "version": {
-                "major": int(parsed[0]),
-                "minor": int(parsed[1]),
-                "patch": int(parsed[2]),
-            },
+            "timestamp": list_timestamp(),
+            "version": list_version(version),
             "tags": {},
             "logoURI": "https://onekey-asset.com/assets/logo.png",
             "keywords": ["onekey", "default"],
             "tokens": tokens,
         }
-
-        with open(f"./build/{impl}{owner}.json", "w") as f:
-            f.write(json.dumps(list, sort_keys=True, indent=2))
-        files.append(f"{impl}{owner}")
-    return files
+    return lists
 
 
 def update_version(version):
@@ -328,24 +448,75 @@ def update_version(version):
 
 
 def build_index(files):
-    requires = ""
     exports = ""
     for impl in files:
-        requires += (
-            f'const {format_var_name(impl)}TokenList = require("./{impl}.json");\n'
+        # getters, so a client only parses the lists it actually uses
+        exports += (
+            f'    get {format_var_name(impl)}TokenList() {{ return require("./{impl}.json"); }},\n'
         )
-        exports += f"\t{format_var_name(impl)}TokenList,\n"
-    with open("./build/index.js", "w") as f:
-        f.write(
-            f"""{requires}
-const version = require("./version.json");
+    write_if_changed(
+        "./build/index.js",
+        f"""const version = require("./version.json");
+const manifest = require("./manifest.json");
+
+function chainTokenList(impl, chainId) {{
+    const list = manifest.lists[impl];
+    const chain = list && list.chains[String(chainId)];
+    return chain ? require(`./${{chain.file}}`) : undefined;
+}}
+
+// same rules as normalize_address and normalize_text in script/
+function normalizeAddress(address) {{
+    address = address.trim();
+    return address.slice(0, 2).toLowerCase() === "0x" ? address.toLowerCase() : address;
+}}
+
+function normalizeText(text) {{
+    return text.normalize("NFKC").toLowerCase().split(/\\s+/).filter(Boolean).join(" ");
+}}
+
+function findToken(impl, chainId, address) {{
+    const list = manifest.lists[impl];
+    if (!list) return undefined;
+    const index = require(`./${{list.index.file}}`);
+    const positions = index.addresses[String(chainId)];
+    const position = positions && positions[normalizeAddress(address)];
+    return position === undefined ? undefined : require(`./${{list.file}}`).tokens[position];
+}}
+
+function searchTokens(impl, query, limit = 20) {{
+    const list = manifest.lists[impl];
+    const prefix = normalizeText(query);
+    if (!list || !prefix) return [];
+    const search = require(`./${{list.index.file}}`).search;
+    const tokens = require(`./${{list.file}}`).tokens;
+    let lo = 0;
+    let hi = search.length;
+    while (lo < hi) {{
+        const mid = (lo + hi) >> 1;
+        if (search[mid][0] < prefix) lo = mid + 1;
+        else hi = mid;
+    }}
+    const seen = new Set();
+    const found = [];
+    for (let i = lo; i < search.length && found.length < limit; i++) {{
+        if (!search[i][0].startsWith(prefix)) break;
+        if (seen.has(search[i][1])) continue;
+        seen.add(search[i][1]);
+        found.push(tokens[search[i][1]]);
+    }}
+    return found;
+}}
 
 module.exports = {{
     version,
-{exports}
-}}
-    """
-        )
+    manifest,
+    chainTokenList,
+    findToken,
+    searchTokens,
+{exports}}};
+"""
+    )
 
 
 def format_var_name(name):
@@ -360,11 +531,75 @@ def format_var_name(name):
 
 
 if __name__ == "__main__":
-    version = None
-    if len(sys.argv) > 1:
-        version = sys.argv[1]
-    p = TokenProcesser("./tokens")
-
-    network_tokens = p.fetch_tokens()
+    parser = argparse.ArgumentParser(description="build the token lists")
+    parser.add_argument("version", nargs="?", default=None)
+    parser.add_argument("--cache-dir", default="./.cache/http",
+                        help="where http responses are cached between runs")
+    parser.add_argument("--offline", action="store_true",
+                        help="build from the http cache only")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only refetch networks whose inputs changed")
+    parser.add_argument("--state", default="./.cache/build_state.json",
+                        help="fingerprints kept between incremental builds")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="networks fetched in parallel (default: all)")
+    parser.add_argument("--checkpoints", default="./.cache/checkpoints",
+                        help="where progress is saved so a failed run can resume")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="discard checkpoints of an earlier failed run")
+    parser.add_argument("--previous", default=None,
+                        help="build dir of the release to diff against "
+                        "(default: the current ./build)")
+    parser.add_argument("--verify", action="store_true",
+                        help="verify tokens on chain before writing, "
+                        "like check_fix.py but in the same pass")
+    parser.add_argument("--index", default=None,
+                        help="with --verify, use the sharded token info index "
+                        "in this dir instead of token_info.json")
+    parser.add_argument("--keep-spam", action="store_true",
+                        help="keep third-party tokens that look like impersonators")
+    parser.add_argument("--check-logos", action="store_true",
+                        help="drop logoURIs that do not serve an image")
+    parser.add_argument("--logo-workers", type=int, default=16,
+                        help="logo urls checked in parallel")
+    parser.add_argument("--logo-mirror", default=None,
+                        help="with --check-logos, keep a content-addressed "
+                        "copy of every logo in this dir")
+    parser.add_argument("--logo-mirror-url", default=None,
+                        help="base url the mirror is published at; logoURIs "
+                        "are rewritten to point there")
+    parser.add_argument("--quiet", action="store_true",
+                        help="skip the per-token output")
+    parser.add_argument("--report", default=None,
+                        help="write a json run report to this file")
+    args = parser.parse_args()
+    metrics.quiet = args.quiet
+
+    version = args.version
+    checkpoints = Checkpoints(args.checkpoints, resume=not args.no_resume)
+    p = TokenProcesser("./tokens", HttpCache(
+        args.cache_dir, offline=args.offline), checkpoints)
+
+    p.spam_filter = not args.keep_spam
+    state = load_build_state(args.state) if args.incremental else None
+    try:
+        network_tokens = p.fetch_tokens(state, workers=args.workers)
+    finally:
+        checkpoints.close()
     impl_list = p.merge_list_by_impl(network_tokens)
-    build(version=version, impl_list=impl_list)
+    if args.verify:
+        verify_impl_list(dict((n["id"], n) for n in p.networks),
+                         impl_list, args.index)
+    if args.check_logos:
+        with LogoValidator(workers=args.logo_workers,
+                           mirror_dir=args.logo_mirror) as validator:
+            validate_logos(impl_list, validator,
+                           args.logo_mirror_url if args.logo_mirror else None)
+    with metrics.timer("build"):
+        build(version=version, impl_list=impl_list,
+              incremental=args.incremental, previous=args.previous)
+    if state is not None:
+        save_build_state(args.state, state)
+    checkpoints.clear()
+    if args.report:
+        metrics.write(args.report)
@@ -1,10 +1,20 @@
+import argparse
+import base64
 import json
 import os
 from pathlib import Path
 import tty
 from unicodedata import decimal
-import requests
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from artifacts import write_artifacts
+from journal import JournaledDict
+from metrics import metrics, log
+from rpc_pool import EndpointPool, EndpointError, check_batch, check_reply
+import solana
+from token_info_index import IndexedTokenInfo
+from verify_cache import VerificationCache, OK, INVALID, ERROR
 
 class InvalidContractError(Exception):
     def __init__(self, value):
@@ -20,10 +30,74 @@ def _extract_eth_call_str(data: bytes) -> str:
     return str_result
 
 
+def _decode_token_info(name_result, symbol_result, decimals_result):
+    try:
+        name = _extract_eth_call_str(bytes.fromhex(name_result[2:]))
+    except Exception:
+        name = None
+
+    try:
+        symbol = _extract_eth_call_str(bytes.fromhex(symbol_result[2:]))
+    except Exception:
+        symbol = None
+
+    try:
+        decimals = int(decimals_result, base=16)
+    except Exception:
+        decimals = None
+
+    return name, symbol, decimals
+
+
+token_manager_classes = {}
+
+
+def register_token_manager(impl):
+    '''class decorator making `create_token_manager` use the class for `impl`'''
+    def register(cls):
+        token_manager_classes[impl] = cls
+        return cls
+    return register
+
+
 class BaseTokenManager(object):
 
-    def __init__(self, url=None):
-        self.url = url
+    # how many tokens `check_tokens` hands to `get_tokens_info` at once
+    batch_size = 1
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        # block height (or slot) seen by the latest lookup, when the rpc tells
+        self.last_block = None
+
+    def post(self, jsonrpc_data, validate=check_reply):
+        '''post a json-rpc payload through the network's endpoint pool'''
+        return self.pool.post(jsonrpc_data, validate)
+
+    def post_batch(self, jsonrpc_data):
+        '''post a json-rpc batch and return its replies keyed by request id
+
+        A node that rejects the whole batch (too large, rate limited) answers
+        with a single error object instead of a list; the pool tries the
+        next endpoint, and when every one refuses it the batch is split in
+        halves.
+        '''
+        try:
+            reply = self.post(jsonrpc_data, check_batch)
+        except EndpointError as e:
+            if not e.rejected or len(jsonrpc_data) < 2:
+                raise
+            half = len(jsonrpc_data) // 2
+            replies = self.post_batch(jsonrpc_data[:half])
+            replies.update(self.post_batch(jsonrpc_data[half:]))
+            return replies
+        replies = {}
+        for item in reply:
+            try:
+                replies[int(item.get("id"))] = item
+            except (AttributeError, TypeError, ValueError):
+                continue
+        return replies
 
     def normalize_token_id(self, token_id):
         return token_id
@@ -31,9 +105,43 @@ class BaseTokenManager(object):
     def get_token_info(self, token_id):
         return None, None, None
 
+    def get_tokens_info(self, token_ids):
+        '''map each token id to its (name, symbol, decimals) or InvalidContractError
+
+        A manager may also map a token to the EndpointError its lookup hit;
+        the rest of the batch is kept. InvalidContractError is only for a
+        node that answered, since it prunes the token.
+        '''
+        infos = {}
+        for token_id in token_ids:
+            try:
+                infos[token_id] = self.get_token_info(token_id)
+            except InvalidContractError as e:
+                infos[token_id] = e
+        return infos
 
+
+@register_token_manager("evm")
 class EVMTokenManager(BaseTokenManager):
 
+    # tokens per batch, lowered to the endpoints' `batch_limit`
+    batch_size = 24
+
+    # name(), symbol(), decimals()
+    selectors = ["0x06fdde03", "0x95d89b41", "0x313ce567"]
+
+    code_method = "eth_getCode"
+    call_method = "eth_call"
+    block_method = "eth_blockNumber"
+    block_tag = "latest"
+
+    def __init__(self, pool=None):
+        super().__init__(pool)
+        if pool is not None:
+            # 4 calls per token plus eth_blockNumber must fit in one batch
+            self.batch_size = max(min(
+                self.batch_size, (pool.batch_limit - 1) // (1 + len(self.selectors))), 1)
+
     def normalize_token_id(self, token_id):
         token_id = token_id.lower()
         if not token_id.startswith("0x"):
@@ -41,122 +149,389 @@ class EVMTokenManager(BaseTokenManager):
         return token_id
 
     def get_token_info(self, token_id):
-        jsonrpc_data = dict(
-            jsonrpc="2.0",
-            method="eth_getCode",
-            id=1,
-            params=[token_id, "latest"]
-        )
-        resp = requests.post(self.url, json=jsonrpc_data, timeout=30)
-            
-        result = resp.json()
-
-        if result.get("result") is None:
-            print(f"  - {token_id} is not a contract.")
-            raise InvalidContractError(f"  - {token_id} is not a contract.")
-
-        jsonrpc_data = list(
-            dict(
+        info = self.get_tokens_info([token_id])[token_id]
+        if isinstance(info, Exception):
+            raise info
+        return info
+
+    def get_tokens_info(self, token_ids):
+        '''look up many tokens with a single json-rpc batch
+
+        Each token gets `eth_getCode` plus one `eth_call` per selector, with
+        request ids `index * 4 + n` so the replies can be matched back to
+        their token whatever order the node returns them in. A token whose
+        code or calls came back as rpc errors maps to an EndpointError.
+        '''
+        calls_per_token = 1 + len(self.selectors)
+        jsonrpc_data = []
+        for index, token_id in enumerate(token_ids):
+            base_id = index * calls_per_token
+            jsonrpc_data.append(dict(
                 jsonrpc="2.0",
-                method="eth_call",
-                id=id,
-                params=[{"to": token_id, "data": call_data}, "latest"]
-            )
-            for id, call_data in enumerate(
-                ["0x06fdde03", "0x95d89b41", "0x313ce567"], start=2
-            )
-        )
-        resp = requests.post(self.url, json=jsonrpc_data, timeout=30)
-        resp = sorted(resp.json(), key=lambda i: int(i.get("id", 5)))
-        try:
-            name = _extract_eth_call_str(bytes.fromhex(resp[0]["result"][2:]))
-        except Exception:
-            name = None
-
-        try:
-            symbol = _extract_eth_call_str(
-                bytes.fromhex(resp[1]["result"][2:]))
-        except Exception:
-            symbol = None
+                method=self.code_method,
+                id=base_id,
+                params=[token_id, self.block_tag]
+            ))
+            for n, call_data in enumerate(self.selectors, start=1):
+                jsonrpc_data.append(dict(
+                    jsonrpc="2.0",
+                    method=self.call_method,
+                    id=base_id + n,
+                    params=[{"to": token_id, "data": call_data}, self.block_tag]
+                ))
+        block_id = len(token_ids) * calls_per_token
+        jsonrpc_data.append(dict(
+            jsonrpc="2.0",
+            method=self.block_method,
+            id=block_id,
+            params=[]
+        ))
 
+        replies = self.post_batch(jsonrpc_data)
         try:
-            decimals = int(resp[2]["result"], base=16)
-        except Exception:
-            decimals = None
-
-        return name, symbol, decimals
-
-
-class NearTokenManager(BaseTokenManager):
+            self.last_block = int(replies[block_id]["result"], base=16)
+        except (KeyError, TypeError, ValueError):
+            self.last_block = None
+
+        infos = {}
+        for index, token_id in enumerate(token_ids):
+            base_id = index * calls_per_token
+            code = replies.get(base_id)
+            calls = [replies.get(base_id + n) for n in range(1, calls_per_token)]
+            if code is None or code.get("result") is None:
+                # no answer about the code: rate limited, pruned state, ...
+                infos[token_id] = EndpointError(
+                    f"{self.code_method} {token_id}: {(code or {}).get('error')}")
+                continue
+            if not self.is_contract(code["result"]):
+                log(f"  - {token_id} is not a contract.")
+                infos[token_id] = InvalidContractError(
+                    f"  - {token_id} is not a contract.")
+                continue
+            failed = [call for call in calls if not self.answered(call)]
+            if failed:
+                infos[token_id] = EndpointError(
+                    f"{self.call_method} {token_id}: {(failed[0] or {}).get('error')}")
+                continue
+            infos[token_id] = _decode_token_info(
+                *(call.get("result") for call in calls))
+        return infos
+
+    def answered(self, call):
+        '''whether the node answered a call, a revert (no such method) included'''
+        if call is None:
+            return False
+        error = call.get("error")
+        return error is None or "revert" in str(error).lower()
+
+    def is_contract(self, code):
+        # nodes answer "0x" for an address without code
+        return code not in (None, "0x")
+
+
+class ConcurrentTokenManager(BaseTokenManager):
+    '''for rpcs without batch requests: a batch is looked up from threads'''
+
+    batch_size = 20
+    # lookups in flight per batch; the endpoint limiter still caps the rate
+    workers = 8
+
+    def get_tokens_info(self, token_ids):
+        '''look up a batch of tokens concurrently over the pooled sessions
+
+        A token whose lookup fails maps to its EndpointError.
+        '''
+        def lookup(token_id):
+            try:
+                return self.get_token_info(token_id)
+            except (InvalidContractError, EndpointError) as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(min(self.workers, len(token_ids)), 1)) as executor:
+            return dict(zip(token_ids, executor.map(lookup, token_ids)))
+
+
+@register_token_manager("near")
+class NearTokenManager(ConcurrentTokenManager):
+
+    # code_hash of an account that has no contract deployed
+    empty_code_hash = "11111111111111111111111111111111"
 
     def normalize_token_id(self, token_id):
         return token_id
 
-    def get_token_info(self, token_id):
+    def query(self, params):
         jsonrpc_data = dict(
             jsonrpc="2.0",
             method="query",
             id=1,
-            params={
-                "request_type": "view_code",
-                "finality": "final",
-                "account_id": token_id
-            }
+            params=dict(params, finality="final")
         )
-        resp = requests.post(self.url, json=jsonrpc_data, timeout=30)
-        result = resp.json()["result"]
-        if len(result) == 0:
-            print(f"  - {token_id} is not a contract.")
-            raise InvalidContractError(f"  - {token_id} is not a contract.")
+        result = self.post(jsonrpc_data)
+        return result.get("result"), result.get("error")
 
-        jsonrpc_data = dict(
-            jsonrpc="2.0",
-            method="query",
-            id=1,
-            params={
-                "request_type": "call_function",
-                "finality": "final",
-                "account_id": token_id,
-                "method_name": "ft_metadata",
-                "args_base64": ""
-            }
-        )
-        resp = requests.post(self.url, json=jsonrpc_data, timeout=30)
+    def get_token_info(self, token_id):
+        # view_account only returns the code hash, view_code the whole wasm
+        account, error = self.query(dict(
+            request_type="view_account", account_id=token_id))
+        if account is None:
+            cause = ((error or {}).get("cause") or {}).get("name")
+            if cause not in ("UNKNOWN_ACCOUNT", "INVALID_ACCOUNT"):
+                raise EndpointError(f"view_account {token_id}: {error}")
+            account = {}
+        else:
+            self.last_block = account.get("block_height")
+        if account.get("code_hash", self.empty_code_hash) == self.empty_code_hash:
+            log(f"  - {token_id} is not a contract.")
+            raise InvalidContractError(f"  - {token_id} is not a contract.")
 
-        info = bytearray(resp.json()["result"]["result"]).decode("utf-8")
-        info = json.loads(info)
-        name = info.get("name")
-        symbol = info.get("symbol")
+        result, error = self.query(dict(
+            request_type="call_function",
+            account_id=token_id,
+            method_name="ft_metadata",
+            args_base64=""
+        ))
+        if result is None:
+            cause = ((error or {}).get("cause") or {}).get("name")
+            if cause != "CONTRACT_EXECUTION_ERROR":
+                # TIMEOUT, rate limits, ...: no answer about the contract
+                raise EndpointError(f"ft_metadata {token_id}: {error}")
+            return None, None, None
+        try:
+            # older nodes report a failed call inside the result
+            info = json.loads(bytearray(result["result"]).decode("utf-8"))
+        except Exception:
+            return None, None, None
         decimals = info.get("decimals")
-        return name, symbol, int(decimals)
+        return info.get("name"), info.get("symbol"), \
+            int(decimals) if decimals is not None else None
 
 
+@register_token_manager("sol")
 class SolTokenManager(BaseTokenManager):
 
+    # a mint and its metadata account per token, getMultipleAccounts takes 100 keys
+    batch_size = 50
+
     def normalize_token_id(self, token_id):
         return token_id
 
     def get_token_info(self, token_id):
+        info = self.get_tokens_info([token_id])[token_id]
+        if isinstance(info, InvalidContractError):
+            raise info
+        return info
+
+    def get_tokens_info(self, token_ids):
+        '''look up mints and their metaplex metadata with one getMultipleAccounts
+
+        Decimals come from the spl mint account, name and symbol from the
+        metadata PDA. A token without metadata keeps (None, None, decimals).
+        '''
+        infos = {}
+        keys = []
+        for token_id in token_ids:
+            if solana.decode_pubkey(token_id) is None:
+                log(f"  - {token_id} is not a contract.")
+                infos[token_id] = InvalidContractError(
+                    f"  - {token_id} is not a contract.")
+                continue
+            keys.append(token_id)
+        if not keys:
+            return infos
+
+        accounts = []
+        for token_id in keys:
+            accounts += [token_id, solana.metadata_address(token_id)]
         jsonrpc_data = dict(
             jsonrpc="2.0",
-            method="getAccountInfo",
+            method="getMultipleAccounts",
             id=1,
-            params=[token_id, {"encoding": "jsonParsed"}]
+            params=[accounts, {"encoding": "base64"}]
         )
-        resp = requests.post(self.url, json=jsonrpc_data, timeout=30)
-        result = resp.json()
-        if result.get("result") is None:
-            print(f"  - {token_id} is not a contract.")
-            raise InvalidContractError(f"  - {token_id} is not a contract.")
+        result = self.post(jsonrpc_data).get("result")
+        if result is None:
+            raise EndpointError("getMultipleAccounts returned no result")
+        self.last_block = result.get("context", {}).get("slot")
+        values = result.get("value")
+        if not isinstance(values, list) or len(values) != len(accounts):
+            # a missing entry would read as a missing mint
+            raise EndpointError("getMultipleAccounts returned a partial result")
+
+        for index, token_id in enumerate(keys):
+            mint, metadata = values[index * 2], values[index * 2 + 1]
+            if mint is None:
+                log(f"  - {token_id} is not a contract.")
+                infos[token_id] = InvalidContractError(
+                    f"  - {token_id} is not a contract.")
+                continue
+            decimals = solana.decode_mint(
+                mint.get("owner"), base64.b64decode(mint["data"][0]))
+            if decimals is None:
+                infos[token_id] = (None, None, None)
+                continue
+            name, symbol = None, None
+            if metadata is not None and metadata.get("owner") == solana.METADATA_PROGRAM_ID:
+                name, symbol = solana.decode_metadata(
+                    base64.b64decode(metadata["data"][0]))
+            infos[token_id] = (name, symbol, decimals)
+        return infos
+
+
+@register_token_manager("cosmos")
+class CosmosTokenManager(BaseTokenManager):
+    '''bank module denoms over the LCD rest api
+
+    All denom metadata of the chain is read once, page by page, and reused
+    for every batch; a denom without metadata exists if it has a supply.
+    '''
+
+    batch_size = 100
+    page_size = 1000
+
+    def __init__(self, pool=None):
+        super().__init__(pool)
+        self.metadata = None
+        self.metadata_lock = threading.Lock()
+
+    def load_metadata(self):
+        with self.metadata_lock:
+            if self.metadata is not None:
+                return self.metadata
+            metadata = {}
+            key = None
+            while True:
+                params = {"pagination.limit": self.page_size}
+                if key:
+                    params["pagination.key"] = key
+                result = self.pool.get(
+                    "/cosmos/bank/v1beta1/denoms_metadata", params) or {}
+                for item in result.get("metadatas", []):
+                    metadata[item.get("base")] = item
+                key = (result.get("pagination") or {}).get("next_key")
+                if not key:
+                    break
+            self.metadata = metadata
+            return metadata
+
+    def decode_metadata(self, item):
+        display = item.get("display")
         decimals = None
-        try:
-            result = result["result"]
-            if result["value"]["data"]["parsed"]["type"] == "mint":
-                decimals = result["value"]["data"]["parsed"]["info"]["decimals"]
-        except Exception:
-            return None, None, None
+        for unit in item.get("denom_units", []):
+            if unit.get("denom") == display:
+                decimals = int(unit.get("exponent", 0))
+        return item.get("name") or None, item.get("symbol") or None, decimals
+
+    def get_tokens_info(self, token_ids):
+        metadata = self.load_metadata()
+        infos = {}
+        for token_id in token_ids:
+            item = metadata.get(token_id)
+            if item is not None:
+                infos[token_id] = self.decode_metadata(item)
+                continue
+            result = self.pool.get(
+                "/cosmos/bank/v1beta1/supply/by_denom", {"denom": token_id})
+            if result is None:
+                # sdk before 0.46 only has the denom in the path
+                result = self.pool.get(
+                    f"/cosmos/bank/v1beta1/supply/{token_id}") or {}
+            if int((result.get("amount") or {}).get("amount") or 0) == 0:
+                log(f"  - {token_id} is not a contract.")
+                infos[token_id] = InvalidContractError(
+                    f"  - {token_id} is not a contract.")
+                continue
+            infos[token_id] = (None, None, None)
+        return infos
+
+
+@register_token_manager("algo")
+class AlgoTokenManager(ConcurrentTokenManager):
+    '''standard assets from the indexer configured on the rpc entry'''
+
+    def get_token_info(self, token_id):
+        result = self.pool.get(f"/v2/assets/{token_id}", base="indexer")
+        if result is None or result.get("asset", {}).get("deleted"):
+            log(f"  - {token_id} is not a contract.")
+            raise InvalidContractError(f"  - {token_id} is not a contract.")
+        self.last_block = result.get("current-round")
+        params = result["asset"].get("params", {})
+        return params.get("name"), params.get("unit-name"), params.get("decimals")
+
+
+@register_token_manager("cfx")
+class CfxTokenManager(EVMTokenManager):
+    '''conflux core space: the evm batch with cfx_* methods'''
+
+    code_method = "cfx_getCode"
+    call_method = "cfx_call"
+    block_method = "cfx_epochNumber"
+    block_tag = "latest_state"
 
-        return None, None, decimals
+    def normalize_token_id(self, token_id):
+        # base32 addresses (CIP-37) are case-insensitive
+        return token_id.lower()
+
+
+@register_token_manager("stc")
+class StcTokenManager(BaseTokenManager):
+    '''starcoin tokens, read as `0x1::Token::TokenInfo<T>` resources
+
+    A token id is its type tag, `address::module::name`; the name part is
+    the symbol and the scaling factor gives the decimals.
+    '''
+
+    batch_size = 50
+
+    def __init__(self, pool=None):
+        super().__init__(pool)
+        if pool is not None:
+            # one call per token plus chain.info
+            self.batch_size = max(min(self.batch_size, pool.batch_limit - 1), 1)
+
+    def get_tokens_info(self, token_ids):
+        jsonrpc_data = [
+            dict(
+                jsonrpc="2.0",
+                method="state.get_resource",
+                id=index,
+                params=[token_id.split("::")[0],
+                        f"0x00000000000000000000000000000001::Token::TokenInfo<{token_id}>",
+                        {"decode": True}]
+            )
+            for index, token_id in enumerate(token_ids)
+        ]
+        jsonrpc_data.append(dict(
+            jsonrpc="2.0", method="chain.info", id=len(token_ids), params=[]))
+
+        replies = self.post_batch(jsonrpc_data)
+        try:
+            self.last_block = int(
+                replies[len(token_ids)]["result"]["head"]["number"])
+        except (KeyError, TypeError, ValueError):
+            self.last_block = None
+
+        infos = {}
+        for index, token_id in enumerate(token_ids):
+            reply = replies.get(index)
+            if reply is None or reply.get("error") is not None:
+                infos[token_id] = EndpointError(
+                    f"state.get_resource {token_id}: {(reply or {}).get('error')}")
+                continue
+            resource = reply.get("result")
+            if resource is None:
+                log(f"  - {token_id} is not a contract.")
+                infos[token_id] = InvalidContractError(
+                    f"  - {token_id} is not a contract.")
+                continue
+            decimals = None
+            try:
+                scaling_factor = int(resource["json"]["scaling_factor"])
+                decimals = len(str(scaling_factor)) - 1
+            except (KeyError, TypeError, ValueError):
+                pass
+            infos[token_id] = (None, token_id.split("::")[-1], decimals)
+        return infos
 
 
 def load_networks(dir):
@@ -179,122 +554,242 @@ def load_networks(dir):
 
 
 token_managers = {}
+token_managers_lock = threading.Lock()
 
 
-def create_token_manager(impl, chain_id, url):
+def create_token_manager(impl, chain_id, network):
     id = f'{impl}--{chain_id}'
 
-    tm = token_managers.get(id, None)
-    if tm is not None:
-        return tm
+    with token_managers_lock:
+        tm = token_managers.get(id, None)
+        if tm is not None:
+            return tm
 
-    if impl == "evm":
-        tm = EVMTokenManager(url)
-    if impl == "near":
-        tm = NearTokenManager(url)
-    if impl == "sol":
-        tm = SolTokenManager(url)
-    if tm is not None:
+        cls = token_manager_classes.get(impl)
+        if cls is None or network is None:
+            return None
+        tm = cls(EndpointPool.from_network(network))
         token_managers[id] = tm
-    return tm
+        return tm
 
 
 def check_token(token, info, id):
     ''''''
     for field in ["name", "symbol"]:
         if info.get(field) is not None and info[field] != "" and info[field] != token[field]:
-            print(
+            log(
                 f'check {id} not same at [{field}]: {token[field]} vs {info[field]}')
             token[field] = info[field]
     for field in ["decimals"]:
         if info.get(field) is not None and info[field] != token.get(field):
-            print(
+            log(
                 f'check {id} not same at [{field}]: {token.get(field)} vs {info[field]}')
             token[field] = info[field]
 
 
-def check_tokens(impl, networks, tokens, token_info):
-    ''''''
+def check_chain(impl, network, tokens, token_info, verify_cache=None):
+    '''verify uncached tokens of one chain, returning the invalid addresses'''
     invalid_token_ids = {}
-    for token in tokens:
-        token_id = f'{token["chainId"]}--{token["address"]}'
-        if token_info.get(token_id, None) is not None:
-            check_token(token, token_info[token_id], f'{impl}--{token_id}')
-            continue
+    chain_id = network["chainId"]
+    tm = create_token_manager(impl, chain_id, network)
+    if tm is None:
+        return invalid_token_ids
 
-        id = f'{impl}--{token["chainId"]}'
+    for i in range(0, len(tokens), tm.batch_size):
+        batch = tokens[i:i + tm.batch_size]
+        for token in batch:
+            log(impl, chain_id, token)
 
-        network = networks.get(id)
-        tm = create_token_manager(
-            impl, token['chainId'], network.get("rpcURLs", [{}])[0].get("url"))
-        if tm is None:
-            continue
-
-        print(impl, token['chainId'], token)
         try:
+            with metrics.timer(f"check.{impl}--{chain_id}"):
+                infos = tm.get_tokens_info(
+                    [token["address"] for token in batch])
+        except EndpointError as e:
+            print(f"  - {impl} {chain_id} lookup failed: {e}")
+            if verify_cache is not None:
+                for token in batch:
+                    verify_cache.record(
+                        f'{impl}--{token["chainId"]}--{token["address"]}', ERROR)
+            continue
 
-            name, symbol, decimals = tm.get_token_info(token["address"])
+        batch_infos = {}
+        for token in batch:
+            token_id = f'{token["chainId"]}--{token["address"]}'
+            result = infos.get(token["address"])
+            if isinstance(result, InvalidContractError):
+                # only raised on a node's answer, so it is safe to keep for a ttl
+                invalid_token_ids[token["address"]] = True
+                if verify_cache is not None:
+                    verify_cache.record(
+                        f'{impl}--{token_id}', INVALID, tm.last_block)
+                continue
+            if result is None or isinstance(result, EndpointError):
+                # no answer is not an answer: retry after the short error ttl
+                if verify_cache is not None:
+                    verify_cache.record(f'{impl}--{token_id}', ERROR)
+                continue
+
+            name, symbol, decimals = result
             info = dict(id=f'{impl}--{token_id}', name=name,
                         symbol=symbol, decimals=decimals)
             check_token(token, info, f'{impl}--{token_id}')
 
-            token_info[token_id] = info
-
-            with open('./token_info.json', 'w') as f:
-                f.write(json.dumps(token_info, sort_keys=True, indent=2))
-                f.write("\n")
-        except InvalidContractError:
-            invalid_token_ids[token["address"]] = True
+            batch_infos[token_id] = info
+            if verify_cache is not None:
+                verify_cache.record(f'{impl}--{token_id}', OK, tm.last_block)
+        # one journal write per batch rather than per token
+        token_info.update(batch_infos)
 
-        time.sleep(1)
+    metrics.count_tokens(f'{impl}--{chain_id}', "looked_up", len(tokens))
+    metrics.count_tokens(f'{impl}--{chain_id}',
+                         "invalid", len(invalid_token_ids))
     return invalid_token_ids
 
 
-def check_files(impl, networks, files):
+def check_tokens(impl, networks, tokens, token_info, verify_cache=None):
     ''''''
-    token_info = {}
-    try:
-        with open('./token_info.json', 'r') as f:
-            token_info = json.load(f)
-    except Exception:
-        token_info = {}
-    for file in files:
-        with open(file, "r") as f:
-            data = json.load(f)
-        tokens = data.get("tokens", [])
+    invalid_token_ids = {}
+    pending = {}
+    for token in tokens:
+        token_id = f'{token["chainId"]}--{token["address"]}'
+        status = None
+        if verify_cache is not None:
+            status = verify_cache.lookup(f'{impl}--{token_id}')
+            if status == INVALID:
+                invalid_token_ids[token["address"]] = True
+                continue
+            if status == ERROR:
+                continue
+
+        info = token_info.get(token_id, None)
+        metrics.cache("token_info", info is not None)
+        if info is not None:
+            if verify_cache is None or status == OK:
+                check_token(token, info, f'{impl}--{token_id}')
+                continue
+            if f'{impl}--{token_id}' not in verify_cache:
+                # verified before the cache existed; trust it for one ttl
+                verify_cache.record(f'{impl}--{token_id}', OK)
+                check_token(token, info, f'{impl}--{token_id}')
+                continue
+        pending.setdefault(token["chainId"], []).append(token)
+
+    if len(pending) == 0:
+        return invalid_token_ids
+
+    # chains are independent; each one is paced by its endpoint's limiter
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        jobs = [
+            executor.submit(check_chain, impl,
+                            networks.get(f'{impl}--{chain_id}'), chain_tokens,
+                            token_info, verify_cache)
+            for chain_id, chain_tokens in pending.items()
+        ]
+        for job in jobs:
+            invalid_token_ids.update(job.result())
+    return invalid_token_ids
+
 
-        invalid_token_ids = check_tokens(impl, networks, tokens, token_info)
+def check_list(impl, networks, tokens, token_info, verify_cache=None):
+    '''verify `tokens` in place and return the valid ones'''
+    invalid_token_ids = check_tokens(
+        impl, networks, tokens, token_info, verify_cache)
 
-        tokens = [ t for t in tokens if invalid_token_ids.get(t["address"]) is None ]
-        data['tokens'] = tokens
-        with open(file, "w") as f:
-            f.write(json.dumps(data, sort_keys=True, indent=2))
+    kept = [t for t in tokens if invalid_token_ids.get(t["address"]) is None]
+    metrics.count_tokens(impl, "checked", len(tokens))
+    metrics.count_tokens(impl, "kept", len(kept))
+    return kept
 
 
-def check():
+def check_impl_lists(networks, impl_lists, index_dir=None):
+    '''verify {impl: [tokens, ...]} in memory, returning the pruned lists
+
+    Impls are checked in parallel; token_info and the verification cache are
+    opened once for the whole run.
+    '''
+    if len(impl_lists) == 0:
+        return {}
+
+    with open_token_info(index_dir) as token_info, VerificationCache() as verify_cache, \
+            metrics.timer("check"):
+        def check_impl(impl, lists):
+            return [check_list(impl, networks, tokens, token_info, verify_cache)
+                    for tokens in lists]
+
+        with ThreadPoolExecutor(max_workers=len(impl_lists)) as executor:
+            jobs = dict(
+                (impl, executor.submit(check_impl, impl, lists))
+                for impl, lists in impl_lists.items()
+            )
+            return dict((impl, job.result()) for impl, job in jobs.items())
+
+
+def verify_impl_list(networks, impl_list, index_dir=None):
+    '''prune and correct the merged {impl: tokens} of a build before it is written'''
+    checked = check_impl_lists(networks, dict(
+        (impl, [tokens]) for impl, tokens in impl_list.items() if len(tokens) > 0),
+        index_dir)
+    for impl, (tokens,) in checked.items():
+        impl_list[impl] = tokens
+    return impl_list
+
+
+def open_token_info(index_dir=None):
+    '''token_info.json with its journal, or the binary index in `index_dir`'''
+    if index_dir:
+        return IndexedTokenInfo(index_dir)
+    return JournaledDict('./token_info.json')
+
+
+def check(index_dir=None):
     networks = load_networks('./tokens')
 
     dir = "./build"
-    # find json file
-    files = [os.path.join(dir, f) for f in os.listdir(
-        dir) if os.path.isfile(os.path.join(dir, f)) and ".json" in f]
-
-    impl_files = {}
-    for file in files:
-        with open(file, "r") as f:
-            data = json.load(f)
-        tokens = data.get("tokens", [])
-        if len(tokens) == 0:
+    # every list is read once, checked in memory and written once
+    lists = {}
+    for f in sorted(os.listdir(dir)):
+        if not os.path.isfile(os.path.join(dir, f)) or not f.endswith(".json"):
             continue
-        impl = os.path.basename(file).split(".")[0]
-        if impl_files.get(impl) is None:
-            impl_files[impl] = [file]
-        else:
-            impl_files[impl].append(file)
-
-    for impl, files in impl_files.items():
-        check_files(impl, networks, files)
+        with open(os.path.join(dir, f), "r") as file:
+            data = json.load(file)
+        if len(data.get("tokens", [])) == 0:
+            continue
+        lists[f[:-len(".json")]] = data
+
+    if len(lists) == 0:
+        return
+
+    impl_names = {}
+    for name in lists:
+        impl_names.setdefault(name.split(".")[0], []).append(name)
+    checked = check_impl_lists(networks, dict(
+        (impl, [lists[name]["tokens"] for name in names])
+        for impl, names in impl_names.items()), index_dir)
+    for impl, names in impl_names.items():
+        for name, tokens in zip(names, checked[impl]):
+            lists[name]["tokens"] = tokens
+
+    # the release build() made; a list it kept unchanged but this check
+    # changed is published under it
+    try:
+        with open(os.path.join(dir, "version.json")) as f:
+            version = json.load(f).get("version")
+    except (OSError, ValueError):
+        version = None
+    write_artifacts(dir, sorted(lists), lists=lists, version=version)
 
 
 if __name__ == "__main__":
-    check()
+    parser = argparse.ArgumentParser(description="verify built token lists")
+    parser.add_argument("--index", default=None,
+                        help="use the sharded token info index in this dir "
+                        "instead of token_info.json")
+    parser.add_argument("--quiet", action="store_true",
+                        help="skip the per-token output")
+    parser.add_argument("--report", default=None,
+                        help="write a json run report to this file")
+    args = parser.parse_args()
+    metrics.quiet = args.quiet
+    check(args.index)
+    if args.report:
+        metrics.write(args.report)
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import time
+
+from artifacts import write_atomic
+from journal import JournaledDict
+from metrics import metrics
+
+
+class Checkpoints(object):
+    '''progress of one build run, so a failed run resumes where it stopped
+
+    Kept under `dir`, one file per stage:
+
+        coins_list     the raw /coins/list body the run started from
+        markets.json   /coins/markets pages, keyed by the ids they asked for
+        networks.json  merged tokens per network code, with the fingerprint
+                       of what they were built from
+
+    Pages and networks are journaled as soon as they complete. A run that
+    finishes calls `clear()`; checkpoints older than `max_age` are dropped
+    rather than resumed, as are all of them with `resume=False`.
+    '''
+
+    def __init__(self, dir="./.cache/checkpoints", max_age=24 * 3600, resume=True):
+        self.dir = dir
+        started = self.started()
+        if not resume or (started is not None and time.time() - started > max_age):
+            shutil.rmtree(dir, ignore_errors=True)
+            started = None
+        os.makedirs(dir, exist_ok=True)
+        if started is None:
+            with open(os.path.join(dir, "started"), "w") as f:
+                f.write(json.dumps(time.time()))
+        else:
+            print(f"resuming the build checkpointed in {dir}")
+        self.markets = JournaledDict(os.path.join(dir, "markets.json"))
+        self.networks = JournaledDict(os.path.join(dir, "networks.json"))
+
+    def started(self):
+        try:
+            with open(os.path.join(self.dir, "started")) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def coins_list(self):
+        '''the checkpointed /coins/list body, or None'''
+        try:
+            with open(os.path.join(self.dir, "coins_list"), "rb") as f:
+                content = f.read()
+        except OSError:
+            content = None
+        metrics.cache("checkpoint", content is not None)
+        return content
+
+    def save_coins_list(self, content):
+        write_atomic(os.path.join(self.dir, "coins_list"), content, fsync=True)
+
+    def page(self, key):
+        '''the checkpointed markets page for `key`, or None'''
+        items = self.markets.get(key)
+        metrics.cache("checkpoint", items is not None)
+        return items
+
+    def network(self, code, fingerprint):
+        '''the checkpointed tokens of network `code`, or None when its
+        inputs changed since (see `TokenProcesser.fingerprint`)'''
+        entry = self.networks.get(code)
+        tokens = None
+        if entry is not None and entry.get("fingerprint") == fingerprint:
+            tokens = entry["tokens"]
+        metrics.cache("checkpoint", tokens is not None)
+        return tokens
+
+    def close(self):
+        self.markets.close()
+        self.networks.close()
+
+    def clear(self):
+        '''forget the run; the next one starts from scratch'''
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
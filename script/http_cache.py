@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from urllib.parse import urlencode
+
+import requests
+
+from artifacts import write_atomic
+from metrics import metrics
+
+
+# seconds a cached response is served without asking the server again
+DEFAULT_TTLS = {
+    "coins_list": 24 * 3600,
+    "markets": 3600,
+    "token_list": 6 * 3600,
+    "default": 3600,
+}
+
+
+class OfflineCacheMiss(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class CachedResponse(object):
+    '''the bits of a `requests.Response` the build scripts use'''
+
+    def __init__(self, url, path, status_code=200, from_cache=False):
+        self.url = url
+        self.path = path
+        self.status_code = status_code
+        self.from_cache = from_cache
+
+    @property
+    def content(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def open(self):
+        '''binary file object over the body, for streaming parsers'''
+        return open(self.path, "rb")
+
+    def json(self):
+        with open(self.path, "rb") as f:
+            return json.load(f)
+
+
+class HttpCache(object):
+    '''on-disk cache for GET requests with ETag/Last-Modified revalidation
+
+    Each response is stored as `<key>.body` plus `<key>.meta.json`. A
+    response younger than the TTL of its `kind` is served without network
+    access; an older one is revalidated with a conditional request. When the
+    server cannot be reached a stale copy is served, and in `offline` mode
+    the network is never used. The least recently used entries are evicted
+    once the cache grows past `max_bytes`.
+    '''
+
+    def __init__(self, dir="./.cache/http", ttls=None, max_bytes=512 << 20,
+                 offline=False, timeout=60):
+        self.dir = dir
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        # bytes on disk, measured on the first write and tracked afterwards
+        self._total = None
+
+    def _key(self, url, params):
+        full_url = url
+        if params:
+            full_url += "?" + urlencode(sorted(params.items()))
+        return full_url, hashlib.sha256(full_url.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.dir, key[:2], key)
+        return f"{base}.body", f"{base}.meta.json"
+
+    def _load_meta(self, meta_path):
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+
+    def _download(self, resp, path):
+        '''stream a response body to `path` without holding it in memory'''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        finally:
+            resp.close()
+        os.replace(tmp_path, path)
+        return size
+
+    def get(self, url, params=None, kind="default", headers=None, limiter=None):
+        '''fetch `url` through the cache and return a `CachedResponse`
+
+        `limiter` (a `ratelimit.RateLimiter`) paces only requests that
+        actually go to the network.
+        '''
+        full_url, key = self._key(url, params)
+        body_path, meta_path = self._paths(key)
+        meta = self._load_meta(meta_path)
+        if meta is not None and not os.path.exists(body_path):
+            meta = None
+
+        now = time.time()
+        ttl = self.ttls.get(kind, self.ttls["default"])
+        if meta is not None and (self.offline or now - meta["fetched_at"] < ttl):
+            metrics.cache("http", True)
+            os.utime(body_path)
+            return CachedResponse(full_url, body_path, from_cache=True)
+        metrics.cache("http", False)
+        if self.offline:
+            raise OfflineCacheMiss(f"{full_url} is not cached")
+
+        req_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get("etag"):
+                req_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                req_headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with limiter or nullcontext():
+                resp = self.session.get(
+                    url, params=params, headers=req_headers, timeout=self.timeout,
+                    stream=True)
+                if resp.status_code != 304:
+                    resp.raise_for_status()
+                    size = self._download(resp, body_path)
+        except requests.RequestException as e:
+            metrics.request(url, error=True)
+            if meta is None:
+                raise
+            print(f"serve stale {full_url}: {e}")
+            os.utime(body_path)
+            return CachedResponse(full_url, body_path, from_cache=True)
+
+        if resp.status_code == 304:
+            metrics.request(url)
+            meta["fetched_at"] = now
+            self._write(meta_path, json.dumps(meta))
+            os.utime(body_path)
+            return CachedResponse(full_url, body_path, from_cache=True)
+
+        meta = dict(
+            url=full_url,
+            kind=kind,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            fetched_at=now,
+            size=size,
+        )
+        metrics.request(url, bytes=size)
+        self._write(meta_path, json.dumps(meta))
+        with self.lock:
+            if self._total is not None:
+                self._total += meta["size"]
+        self.evict()
+        return CachedResponse(full_url, body_path, resp.status_code)
+
+    def evict(self):
+        '''drop least recently used entries until the cache fits `max_bytes`'''
+        if not self.max_bytes:
+            return
+        with self.lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.dir):
+                for name in files:
+                    if not name.endswith(".body"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            self._total = total
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                for p in (path, path[:-len(".body")] + ".meta.json"):
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+                total -= size
+            self._total = total
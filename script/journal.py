@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+
+
+class JournaledDict(dict):
+    '''dict persisted as a sorted json snapshot plus an append-only journal
+
+    Every write is appended to `<path>.journal` as one json line, so an
+    interrupted run loses nothing. The journal is folded back into the
+    snapshot by `compact()`, which also runs automatically once the journal
+    grows past `compact_bytes`.
+    '''
+
+    def __init__(self, path, journal_path=None, compact_bytes=1 << 20, fsync=True):
+        super().__init__()
+        self.path = path
+        self.journal_path = journal_path or f"{path}.journal"
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self._journal = None
+        self._journal_size = 0
+        self._torn = False
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.load()
+
+    def load(self):
+        '''load the snapshot and replay the journal on top of it'''
+        self.clear()
+        try:
+            with open(self.path, "r") as f:
+                super().update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+        self._torn = False
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    self._torn = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn write at the tail of an interrupted run
+                        continue
+                    if entry.get("v") is None:
+                        super().pop(entry["k"], None)
+                    else:
+                        super().__setitem__(entry["k"], entry["v"])
+            self._journal_size = os.path.getsize(self.journal_path)
+        except OSError:
+            self._journal_size = 0
+
+    def _append_locked(self, key, value):
+        self._append_many_locked([(key, value)])
+
+    def _append_many_locked(self, items):
+        '''journal several entries with a single flush and fsync'''
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a")
+        line = "".join(json.dumps(dict(k=key, v=value), sort_keys=True) + "\n"
+                       for key, value in items)
+        if self._torn:
+            line = "\n" + line
+            self._torn = False
+        self._journal.write(line)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_size += len(line)
+        if self.compact_bytes and self._journal_size >= self.compact_bytes:
+            self._compact_locked()
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self._append_locked(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            super().__delitem__(key)
+            self._append_locked(key, None)
+
+    def pop(self, key, *default):
+        with self._lock:
+            if key in self:
+                self._append_locked(key, None)
+            return super().pop(key, *default)
+
+    def update(self, *args, **kwargs):
+        items = list(dict(*args, **kwargs).items())
+        if len(items) == 0:
+            return
+        with self._lock:
+            super().update(items)
+            self._append_many_locked(items)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def compact(self):
+        '''write the sorted snapshot atomically and truncate the journal'''
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self, sort_keys=True, indent=2))
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        # replaying the old journal over the new snapshot is idempotent,
+        # so a crash between these two steps is harmless
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_size = 0
+
+    def close(self):
+        '''compact pending journal entries and release the file handle'''
+        with self._lock:
+            if self._journal_size > 0:
+                self._compact_locked()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,109 @@
+import codecs
+import json
+import re
+
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DELIMITERS = ",:]} \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _Reader(object):
+    '''incremental json tokenizer over a binary file object'''
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        '''read another chunk, dropping what was consumed; False at eof'''
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode(b"", True)
+            self.pos = 0
+            return False
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''next non-whitespace character without consuming it, "" at eof'''
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        ch = self.peek()
+        if ch == "" or ch not in chars:
+            raise ValueError(
+                f"expected one of {chars!r} but got {ch!r} in json stream")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        '''decode the next complete json value'''
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # a bare number or literal cut by the chunk boundary decodes
+                # as its prefix (`1` of `1.5`); only a delimiter ends it
+                if self.eof or (end < len(self.buf) and (
+                        self.buf[self.pos] in '{["' or self.buf[end] in _DELIMITERS)):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_items(f, path="", chunk_size=1 << 16):
+    '''yield the elements of the json array at `path` in file object `f`
+
+    `path` is a dotted list of object keys (`""` means the document itself
+    is the array). Only one element is held in memory at a time; siblings
+    of the path are decoded and dropped. Yields nothing when the path is
+    missing.
+    '''
+    reader = _Reader(f, chunk_size)
+    keys = [k for k in path.split(".") if k != ""]
+
+    for key in keys:
+        if reader.peek() != "{":
+            return
+        reader.expect("{")
+        found = False
+        if reader.peek() == "}":
+            return
+        while True:
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                found = True
+                break
+            reader.value()
+            if reader.expect(",}") == "}":
+                break
+        if not found:
+            return
+
+    if reader.peek() != "[":
+        return
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from artifacts import write_atomic
+from journal import JournaledDict
+from metrics import metrics
+from ratelimit import get_rate_limiter
+
+
+OK = "ok"
+BROKEN = "broken"
+ERROR = "error"
+
+# seconds a result is trusted before the url is checked again
+DEFAULT_TTLS = {
+    OK: 7 * 24 * 3600,
+    BROKEN: 24 * 3600,
+    ERROR: 3600,
+}
+
+# extensions of mirrored images by content type
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+    "image/x-icon": "ico",
+    "image/vnd.microsoft.icon": "ico",
+}
+
+
+class LogoValidator(object):
+    '''checks logo urls concurrently and remembers the outcome per url
+
+    Each url is fetched with a conditional GET (ETag/Last-Modified from the
+    previous check) on a bounded pool of `workers` threads, at most
+    `per_host` at a time per host. A 2xx image body is `ok` and its sha256
+    is recorded; 4xx, non-image or oversized bodies are `broken`;
+    connection failures and 5xx are `error`, which keeps the logo but
+    retries soon. Results live in a journaled cache keyed by url.
+
+    With `mirror_dir`, ok images are also stored content-addressed as
+    `<mirror_dir>/<sha256[:2]>/<sha256>.<ext>`, so identical images shared
+    by many tokens are kept once.
+    '''
+
+    def __init__(self, path="./.cache/logo_cache.json", ttls=None, workers=16,
+                 per_host=4, timeout=15, max_bytes=2 << 20, mirror_dir=None):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.mirror_dir = mirror_dir
+        self.entries = JournaledDict(path, fsync=False)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+
+    def mirror_path(self, entry):
+        ext = EXTENSIONS.get(entry.get("content_type"), "img")
+        digest = entry["sha256"]
+        return f"{digest[:2]}/{digest}.{ext}"
+
+    def fresh(self, entry, now):
+        if entry is None:
+            return False
+        if now - entry.get("fetched_at", 0) >= self.ttls.get(entry.get("status"), 0):
+            return False
+        # a mirror that lost the file needs the body again
+        return not (self.mirror_dir and entry.get("status") == OK and not os.path.exists(
+            os.path.join(self.mirror_dir, self.mirror_path(entry))))
+
+    def check(self, url, now=None):
+        '''the cache entry for `url`, fetching it when it is not fresh'''
+        now = now or time.time()
+        entry = self.entries.get(url)
+        if self.fresh(entry, now):
+            metrics.cache("logo", True)
+            return entry
+        metrics.cache("logo", False)
+
+        headers = {}
+        if entry is not None and entry.get("status") == OK and (
+                not self.mirror_dir or os.path.exists(
+                    os.path.join(self.mirror_dir, self.mirror_path(entry)))):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        host = urlparse(url).netloc
+        try:
+            with get_rate_limiter(f"logo:{host}", dict(
+                    rate=self.per_host * 5, burst=self.per_host * 5, concurrency=self.per_host)):
+                resp = self.session.get(url, headers=headers, timeout=self.timeout,
+                                        stream=True)
+                try:
+                    result = self.read(url, resp, entry, now)
+                finally:
+                    resp.close()
+        except (requests.RequestException, ValueError) as e:
+            metrics.request(url, error=True)
+            result = dict(status=ERROR, reason=str(e)[:200], fetched_at=now)
+        self.entries[url] = result
+        return result
+
+    def read(self, url, resp, entry, now):
+        if resp.status_code == 304 and entry is not None:
+            metrics.request(url)
+            return dict(entry, fetched_at=now)
+        if resp.status_code >= 500 or resp.status_code == 429:
+            metrics.request(url, error=True)
+            return dict(status=ERROR, reason=f"http {resp.status_code}", fetched_at=now)
+        if resp.status_code >= 400:
+            metrics.request(url)
+            return dict(status=BROKEN, reason=f"http {resp.status_code}", fetched_at=now)
+
+        content_type = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/"):
+            metrics.request(url)
+            return dict(status=BROKEN, reason=f"not an image: {content_type}", fetched_at=now)
+
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        for chunk in resp.iter_content(chunk_size=1 << 16):
+            size += len(chunk)
+            if size > self.max_bytes:
+                metrics.request(url, bytes=size)
+                return dict(status=BROKEN, reason="too large", fetched_at=now)
+            digest.update(chunk)
+            if self.mirror_dir:
+                chunks.append(chunk)
+        metrics.request(url, bytes=size)
+        if size == 0:
+            return dict(status=BROKEN, reason="empty", fetched_at=now)
+
+        result = dict(
+            status=OK,
+            sha256=digest.hexdigest(),
+            content_type=content_type,
+            bytes=size,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            fetched_at=now,
+        )
+        if self.mirror_dir:
+            self.store(self.mirror_path(result), b"".join(chunks))
+        return result
+
+    def store(self, relpath, data):
+        path = os.path.join(self.mirror_dir, relpath)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+
+    def check_all(self, urls):
+        '''{url: entry} for every distinct url, checked concurrently'''
+        urls = sorted(set(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            return dict(zip(urls, executor.map(self.check, urls)))
+
+    def close(self):
+        self.entries.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def validate_logos(impl_list, validator, mirror_url=None):
+    '''drop broken logoURIs from {impl: tokens}; with `mirror_url`, point ok
+    ones at the mirrored copy under that base url
+
+    Changed tokens are copies: the originals may be kept for the next
+    incremental build, which must see the upstream urls again.
+    '''
+    urls = [t["logoURI"] for tokens in impl_list.values() for t in tokens if t.get("logoURI")]
+    with metrics.timer("logos"):
+        results = validator.check_all(urls)
+
+    broken = 0
+    for impl, tokens in impl_list.items():
+        checked = []
+        for token in tokens:
+            entry = results.get(token.get("logoURI"))
+            if entry is not None and entry["status"] == BROKEN:
+                token = dict(token)
+                del token["logoURI"]
+                broken += 1
+            elif entry is not None and entry["status"] == OK and mirror_url:
+                token = dict(token, logoURI=f"{mirror_url.rstrip('/')}/{validator.mirror_path(entry)}")
+            checked.append(token)
+        impl_list[impl] = checked
+    metrics.count_tokens("logos", "checked", len(results))
+    metrics.count_tokens("logos", "broken", broken)
+    print(f"checked {len(results)} logo urls, dropped {broken} broken logos")
+    return impl_list
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class Metrics(object):
+    '''counters and timers for one build or check run
+
+    Records wall time per stage, http requests/bytes/retries/errors per
+    host, cache hit ratios and token counts per network and stage, and
+    writes them as a json run report. `quiet` silences the per-token output
+    that goes through `log`.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.quiet = False
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.timers = {}
+            self.hosts = {}
+            self.caches = {}
+            self.tokens = {}
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                timer = self.timers.setdefault(
+                    name, dict(count=0, seconds=0.0))
+                timer["count"] += 1
+                timer["seconds"] += elapsed
+
+    def request(self, url, bytes=0, retry=False, error=False):
+        host = urlparse(url).netloc or url
+        with self.lock:
+            counters = self.hosts.setdefault(
+                host, dict(requests=0, bytes=0, retries=0, errors=0))
+            counters["requests"] += 1
+            counters["bytes"] += bytes
+            counters["retries"] += int(retry)
+            counters["errors"] += int(error)
+
+    def cache(self, name, hit):
+        with self.lock:
+            counters = self.caches.setdefault(name, dict(hits=0, misses=0))
+            counters["hits" if hit else "misses"] += 1
+
+    def count_tokens(self, network, stage, count):
+        with self.lock:
+            self.tokens.setdefault(network, {})[stage] = count
+
+    def report(self):
+        with self.lock:
+            caches = {}
+            for name, c in self.caches.items():
+                total = c["hits"] + c["misses"]
+                caches[name] = dict(c, hit_ratio=round(
+                    c["hits"] / total, 4) if total else None)
+            return dict(
+                started=self.started,
+                seconds=round(time.time() - self.started, 3),
+                timers=dict((k, dict(count=v["count"], seconds=round(v["seconds"], 4)))
+                            for k, v in sorted(self.timers.items())),
+                hosts=dict(sorted(self.hosts.items())),
+                caches=dict(sorted(caches.items())),
+                tokens=dict(sorted(self.tokens.items())),
+            )
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write(json.dumps(self.report(), sort_keys=True, indent=2))
+            f.write("\n")
+
+
+metrics = Metrics()
+
+
+def log(*args):
+    '''print per-token detail unless the run is quiet'''
+    if not metrics.quiet:
+        print(*args)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    '''token bucket with a cap on concurrent calls
+
+    `rate` tokens are added per second up to `burst`; every call takes one
+    token and one of `concurrency` slots. Use it as a context manager around
+    each request.
+    '''
+
+    def __init__(self, rate=1.0, burst=1, concurrency=1):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max(int(concurrency), 1))
+
+    @classmethod
+    def from_config(cls, config):
+        '''build from the `rate`/`burst`/`concurrency` keys of a chain.json entry'''
+        config = config or {}
+        return cls(
+            rate=config.get("rate", 1.0),
+            burst=config.get("burst", 1),
+            concurrency=config.get("concurrency", 1),
+        )
+
+    def wait(self):
+        '''block until a token is available and take it'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def __enter__(self):
+        self.slots.acquire()
+        try:
+            self.wait()
+        except BaseException:
+            self.slots.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.slots.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key, config=None):
+    '''shared limiter per key (usually an endpoint url), created on first use'''
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter.from_config(config)
+            _limiters[key] = limiter
+        return limiter
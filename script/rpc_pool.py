@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import deque
+
+import requests
+
+from metrics import metrics
+from ratelimit import get_rate_limiter
+
+
+# calls per json-rpc batch when the rpcURLs entry has no `batch_limit`;
+# geth and erigon refuse bigger batches by default
+DEFAULT_BATCH_LIMIT = 100
+
+# json-rpc error codes of a node that is throttling rather than answering
+RATE_LIMIT_CODES = (-32005, -32029, 429)
+
+
+class EndpointError(Exception):
+    '''no endpoint answered; `rejected` when each refused the request itself'''
+
+    def __init__(self, value, rejected=False):
+        self.value = value
+        self.rejected = rejected
+
+    def __str__(self):
+        return repr(self.value)
+
+
+def rate_limited(item):
+    error = item.get("error") if isinstance(item, dict) else None
+    return isinstance(error, dict) and error.get("code") in RATE_LIMIT_CODES
+
+
+def check_reply(body):
+    '''`validate` for single json-rpc calls: a throttled reply is no answer'''
+    if rate_limited(body):
+        raise EndpointError(f"rate limited: {body['error']}")
+
+
+def check_batch(body):
+    '''`validate` for json-rpc batches
+
+    A batch answered with one error object instead of a list was refused as
+    a whole (too large, throttled); a throttled item is no answer either.
+    '''
+    if not isinstance(body, list):
+        raise EndpointError(f"batch rejected: {body}", rejected=True)
+    for item in body:
+        if rate_limited(item):
+            raise EndpointError(f"rate limited: {item['error']}")
+
+
+class Endpoint(object):
+    '''one rpc url with its keep-alive session and health statistics'''
+
+    # weight of the newest sample in the latency moving average
+    alpha = 0.3
+    # number of recent calls used for the error rate
+    window = 20
+
+    def __init__(self, config):
+        self.config = config
+        self.url = config.get("url")
+        self.session = requests.Session()
+        self.limiter = get_rate_limiter(self.url, config)
+        self.latency = None
+        self.results = deque(maxlen=self.window)
+        self.failures = 0
+        self.disabled_until = 0
+        self.lock = threading.Lock()
+
+    def error_rate(self):
+        if len(self.results) == 0:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    def score(self):
+        '''lower is better; unmeasured endpoints score 0 so each gets probed'''
+        if self.latency is None:
+            # never answered: probe it first, unless it has only ever failed
+            return float("inf") if len(self.results) > 0 else 0.0
+        return self.latency * (1 + 4 * self.error_rate())
+
+    def healthy(self, now):
+        return now >= self.disabled_until
+
+    def record_success(self, elapsed):
+        with self.lock:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency = self.alpha * elapsed + \
+                    (1 - self.alpha) * self.latency
+            self.results.append(True)
+            self.failures = 0
+
+    def record_failure(self, cooldown):
+        with self.lock:
+            self.results.append(False)
+            self.failures += 1
+            # back off harder the longer the endpoint keeps failing
+            self.disabled_until = time.monotonic() + cooldown * \
+                min(2 ** (self.failures - 1), 32)
+
+
+class EndpointPool(object):
+    '''routes json-rpc calls to the fastest healthy endpoint of a network
+
+    A call that fails on one endpoint (connection error, timeout, non-2xx
+    status, unparsable body, or a body its `validate` callback refuses) is
+    retried on the next best one; failing endpoints are benched for a
+    growing cooldown.
+    '''
+
+    def __init__(self, rpcs, timeout=30, cooldown=5, retries=None):
+        self.endpoints = [Endpoint(rpc) for rpc in rpcs if rpc.get("url")]
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.retries = len(self.endpoints) if retries is None else retries
+
+    @classmethod
+    def from_network(cls, network):
+        return cls(network.get("rpcURLs", []))
+
+    @property
+    def batch_limit(self):
+        '''most calls one batch may hold on every endpoint'''
+        return min((e.config.get("batch_limit", DEFAULT_BATCH_LIMIT)
+                    for e in self.endpoints), default=DEFAULT_BATCH_LIMIT)
+
+    @property
+    def url(self):
+        ranked = self.ranked()
+        return ranked[0].url if ranked else None
+
+    def ranked(self):
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.healthy(now)]
+        if len(healthy) == 0:
+            # everything is benched; try the one that recovers first
+            return sorted(self.endpoints, key=lambda e: e.disabled_until)
+        return sorted(healthy, key=lambda e: e.score())
+
+    def post(self, jsonrpc_data, validate=check_reply):
+        '''post a json-rpc payload and return the decoded response body
+
+        `validate(body)` raises EndpointError for an error the node answers
+        with http 200, so the call fails over like a transport error;
+        `check_batch` is the one for batches.
+        '''
+        return self.request(lambda endpoint: endpoint.session.post(
+            endpoint.url, json=jsonrpc_data, timeout=self.timeout), validate=validate)
+
+    def get(self, path, params=None, base="url"):
+        '''GET `path` from the rest api of an endpoint, None on 404
+
+        `base` names the key of the rpcURLs entry the path is relative to,
+        e.g. `indexer`; endpoints without it are skipped.
+        '''
+        def send(endpoint):
+            url = endpoint.config.get(base)
+            if not url:
+                raise requests.RequestException(f"no {base} configured")
+            return endpoint.session.get(url.rstrip("/") + path, params=params,
+                                        timeout=self.timeout)
+        return self.request(send, missing_ok=True)
+
+    def request(self, send, missing_ok=False, validate=None):
+        '''run `send(endpoint)` on the best endpoints until one answers'''
+        errors = []
+        for attempt, endpoint in enumerate(self.ranked()[:max(self.retries, 1)]):
+            try:
+                with endpoint.limiter:
+                    start = time.monotonic()
+                    resp = send(endpoint)
+                    if missing_ok and resp.status_code == 404:
+                        # a definite answer about the resource, not a failure
+                        result = None
+                    else:
+                        resp.raise_for_status()
+                        result = resp.json()
+                        if validate is not None:
+                            validate(result)
+                    elapsed = time.monotonic() - start
+            except (requests.RequestException, ValueError, EndpointError) as e:
+                metrics.request(endpoint.url, retry=attempt > 0, error=True)
+                endpoint.record_failure(self.cooldown)
+                print(f"  - rpc {endpoint.url} failed: {e}")
+                errors.append(e)
+                continue
+            metrics.request(endpoint.url, bytes=len(resp.content),
+                            retry=attempt > 0)
+            endpoint.record_success(elapsed)
+            return result
+        raise EndpointError(f"all endpoints failed: {errors}", rejected=len(errors) > 0 and all(
+            isinstance(e, EndpointError) and e.rejected for e in errors))
+
+    def stats(self):
+        return [
+            dict(url=e.url, latency=e.latency, error_rate=e.error_rate())
+            for e in self.endpoints
+        ]
@@ -0,0 +1,288 @@
+'''serve the built token lists over http from one shared process
+
+    GET /tokens/{chainId}/{address}    one token; ?impl= when chainIds clash
+    GET /tokens/{chainId}              tokens of a chain, ?offset=&limit=
+    GET /search?q=usd                  symbol/name prefix search, ?impl=&chainId=&limit=
+    GET /health                        loaded version and snapshot etag
+
+Tokens are answered from in-memory indexes built from `build/` (the
+prebuilt `*.index.json` files) and `token_info.json`. Every answer
+found carries the snapshot's ETag and honours If-None-Match; errors and
+404s carry neither. The build dir is polled; a new build is loaded in
+the background and swapped in with one reference assignment, so requests
+never see a half-loaded snapshot. A build is only loaded once every file
+its manifest lists is there with the listed sha256; until then the
+previous one keeps being served.
+
+    python3 script/serve.py --build ./build --port 8080
+'''
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from artifacts import build_lookup_index, normalize_text
+from token_store import normalize_address
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+
+
+class TokenSnapshot(object):
+    '''immutable view of one build, with its lookup indexes'''
+
+    def __init__(self, dir, token_info_path=None):
+        self.dir = dir
+        self.loaded_at = time.time()
+        self.signature = build_signature(dir, token_info_path)
+        manifest = load_json(os.path.join(dir, "manifest.json")) or {}
+        if not manifest.get("lists"):
+            # `build()` wipes the dir first; an empty one is not a build
+            raise ValueError(f"no token lists in {dir}/manifest.json")
+
+        self.version = (load_json(os.path.join(dir, "version.json")) or {}).get("version")
+        self.token_info = load_json(token_info_path) if token_info_path else {}
+        self.token_info = self.token_info or {}
+        # impl -> tokens; (impl, chainId) -> {address: position}, and the
+        # positions in list order for paging
+        self.tokens = {}
+        self.addresses = {}
+        self.positions = {}
+        self.search_keys = []
+        self.search_refs = []
+        search = []
+        for impl, entry in sorted(manifest["lists"].items()):
+            tokens = load_verified(dir, entry).get("tokens", [])
+            index = load_verified(dir, entry["index"]) if "index" in entry \
+                else build_lookup_index(tokens)
+            self.tokens[impl] = tokens
+            for chain_id, positions in index["addresses"].items():
+                self.addresses[(impl, chain_id)] = positions
+                self.positions[(impl, chain_id)] = sorted(positions.values())
+            search += [(key, impl, position) for key, position in index["search"]]
+        # the shipped index is in javascript order; bisect needs python's
+        search.sort()
+        self.search_keys = [key for key, _, _ in search]
+        self.search_refs = [(impl, position) for _, impl, position in search]
+        self.etag = '"%s"' % hashlib.sha256(
+            f"{self.signature}:{len(self.token_info)}".encode()).hexdigest()[:32]
+
+    def with_info(self, token):
+        info = self.token_info.get(f'{token.get("chainId")}--{token.get("address")}')
+        if info is None:
+            return token
+        return dict(token, info=info)
+
+    def impls_for(self, chain_id, impl=None):
+        if "--" in chain_id:
+            impl, chain_id = chain_id.split("--", 1)
+        impls = [impl] if impl else sorted(self.tokens)
+        return [(i, chain_id) for i in impls if (i, chain_id) in self.addresses]
+
+    def get(self, chain_id, address, impl=None):
+        for key in self.impls_for(chain_id, impl):
+            position = self.addresses[key].get(normalize_address(address))
+            if position is not None:
+                return self.with_info(self.tokens[key[0]][position])
+        return None
+
+    def chain_tokens(self, chain_id, impl=None, offset=0, limit=DEFAULT_LIMIT):
+        keys = self.impls_for(chain_id, impl)
+        if not keys:
+            return None
+        key = keys[0]
+        positions = self.positions[key]
+        tokens = self.tokens[key[0]]
+        return dict(
+            impl=key[0], chainId=key[1], total=len(positions), offset=offset,
+            tokens=[tokens[p] for p in positions[offset:offset + limit]],
+        )
+
+    def search(self, query, impl=None, chain_id=None, limit=DEFAULT_LIMIT):
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        i = bisect.bisect_left(self.search_keys, prefix)
+        while i < len(self.search_keys) and len(found) < limit:
+            if not self.search_keys[i].startswith(prefix):
+                break
+            ref = self.search_refs[i]
+            i += 1
+            if ref in seen or (impl and ref[0] != impl):
+                continue
+            token = self.tokens[ref[0]][ref[1]]
+            if chain_id is not None and str(token.get("chainId")) != chain_id:
+                continue
+            seen.add(ref)
+            found.append(dict(token, impl=ref[0]))
+        return found
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_verified(dir, entry):
+    '''the json file of a manifest entry, if it is there with the listed digest'''
+    path = os.path.join(dir, entry["file"])
+    with open(path, "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != entry.get("sha256"):
+        raise ValueError(f"{path} does not match the manifest")
+    return json.loads(data)
+
+
+def build_signature(dir, token_info_path=None):
+    '''changes whenever a new build lands in `dir` or token_info is rewritten'''
+    parts = []
+    paths = [os.path.join(dir, "manifest.json"), os.path.join(dir, "version.json")]
+    if token_info_path:
+        paths.append(token_info_path)
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{path}:-")
+    return "|".join(parts)
+
+
+class TokenServer(ThreadingHTTPServer):
+    '''http server holding the current snapshot, reloaded when the build changes'''
+
+    daemon_threads = True
+
+    def __init__(self, address, dir, token_info_path=None, reload_interval=5.0):
+        self.dir = dir
+        self.token_info_path = token_info_path
+        self.reload_interval = reload_interval
+        self.reload_lock = threading.Lock()
+        self.snapshot = TokenSnapshot(dir, token_info_path)
+        self.stopped = threading.Event()
+        super().__init__(address, TokenHandler)
+        if reload_interval:
+            threading.Thread(target=self.watch, daemon=True).start()
+
+    def reload(self, force=False):
+        '''load the build in the background and swap it in; True if swapped'''
+        with self.reload_lock:
+            if not force and build_signature(self.dir, self.token_info_path) == self.snapshot.signature:
+                return False
+            try:
+                snapshot = TokenSnapshot(self.dir, self.token_info_path)
+            except Exception as e:
+                # a build that is still being written; keep serving the old one
+                print(f"reload failed, keep serving the previous build: {e}")
+                return False
+            self.snapshot = snapshot
+            print(f"loaded build {snapshot.version} ({snapshot.etag})")
+            return True
+
+    def watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            self.reload()
+
+    def server_close(self):
+        self.stopped.set()
+        super().server_close()
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body are separate writes; don't let nagle hold the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, etag=None):
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # one snapshot per request, whatever reloads happen meanwhile
+        snapshot = self.server.snapshot
+        url = urlparse(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+
+        try:
+            limit = min(max(int(query.get("limit", DEFAULT_LIMIT)), 1), MAX_LIMIT)
+            offset = max(int(query.get("offset", 0)), 0)
+        except ValueError:
+            return self.reply(400, dict(error="offset and limit must be integers"))
+
+        impl = query.get("impl")
+        if parts == ["health"]:
+            return self.reply(200, dict(version=snapshot.version, etag=snapshot.etag,
+                                        loaded_at=snapshot.loaded_at))
+        if len(parts) == 3 and parts[0] == "tokens":
+            token = snapshot.get(parts[1], parts[2], impl)
+            if token is None:
+                return self.reply(404, dict(error="token not found"))
+            return self.reply(200, token, snapshot.etag)
+        if len(parts) == 2 and parts[0] == "tokens":
+            page = snapshot.chain_tokens(parts[1], impl, offset, limit)
+            if page is None:
+                return self.reply(404, dict(error="chain not found"))
+            return self.reply(200, page, snapshot.etag)
+        if parts == ["search"]:
+            return self.reply(200, dict(tokens=snapshot.search(
+                query.get("q", ""), impl, query.get("chainId"), limit)), snapshot.etag)
+        return self.reply(404, dict(error="not found"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serve the built token lists")
+    parser.add_argument("--build", default="./build",
+                        help="build dir to serve")
+    parser.add_argument("--token-info", default="./token_info.json",
+                        help="on-chain metadata attached to tokens as `info`")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--reload-interval", type=float, default=5.0,
+                        help="seconds between checks for a new build (0: never)")
+    args = parser.parse_args()
+
+    server = TokenServer((args.host, args.port), args.build,
+                         args.token_info, args.reload_interval)
+    # `kill -HUP` reloads right away
+    signal.signal(signal.SIGHUP, lambda *_: threading.Thread(
+        target=server.reload, args=(True,), daemon=True).start())
+    print(f"serving {args.build} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,112 @@
+'''helpers to read spl mints and metaplex metadata without a solana sdk'''
+import hashlib
+import struct
+
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+B58_INDEX = dict((c, i) for i, c in enumerate(B58_ALPHABET))
+
+TOKEN_PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+TOKEN_2022_PROGRAM_ID = "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb"
+METADATA_PROGRAM_ID = "metaqbxxUerdq28cj1RbAWkYQm3ybzjb6a8bt518x1s"
+
+MINT_SIZE = 82
+MINT_DECIMALS_OFFSET = 44
+
+# ed25519 field and curve constant, for the off-curve check of PDAs
+_P = 2 ** 255 - 19
+_D = -121665 * pow(121666, _P - 2, _P) % _P
+
+
+def b58decode(value):
+    n = 0
+    for c in value:
+        n = n * 58 + B58_INDEX[c]
+    data = n.to_bytes((n.bit_length() + 7) // 8, "big") if n else b""
+    pad = len(value) - len(value.lstrip("1"))
+    return b"\0" * pad + data
+
+
+def b58encode(data):
+    n = int.from_bytes(data, "big")
+    out = ""
+    while n:
+        n, r = divmod(n, 58)
+        out = B58_ALPHABET[r] + out
+    pad = len(data) - len(data.lstrip(b"\0"))
+    return "1" * pad + out
+
+
+def decode_pubkey(value):
+    '''32 raw bytes of a base58 public key, or None if it is not one'''
+    try:
+        key = b58decode(value)
+    except KeyError:
+        return None
+    return key if len(key) == 32 else None
+
+
+def is_on_curve(key):
+    '''whether 32 bytes decompress to an ed25519 point'''
+    y = int.from_bytes(key, "little") & ((1 << 255) - 1)
+    if y >= _P:
+        return False
+    y2 = y * y % _P
+    u = (y2 - 1) % _P
+    v = (_D * y2 + 1) % _P
+    x2 = u * pow(v, _P - 2, _P) % _P
+    return x2 == 0 or pow(x2, (_P - 1) // 2, _P) == 1
+
+
+def find_program_address(seeds, program_id):
+    '''the program derived address for `seeds`, as raw bytes'''
+    program = decode_pubkey(program_id)
+    for bump in range(255, -1, -1):
+        h = hashlib.sha256()
+        for seed in seeds:
+            h.update(seed)
+        h.update(bytes([bump]))
+        h.update(program)
+        h.update(b"ProgramDerivedAddress")
+        key = h.digest()
+        if not is_on_curve(key):
+            return key
+    raise ValueError("no viable bump seed")
+
+
+def metadata_address(mint):
+    '''base58 address of the metaplex metadata account of `mint`'''
+    return b58encode(find_program_address(
+        [b"metadata", decode_pubkey(METADATA_PROGRAM_ID), decode_pubkey(mint)],
+        METADATA_PROGRAM_ID))
+
+
+def decode_mint(owner, data):
+    '''decimals of an spl mint account, None if the account is not a mint'''
+    if owner not in (TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID):
+        return None
+    if len(data) < MINT_SIZE:
+        return None
+    return data[MINT_DECIMALS_OFFSET]
+
+
+def _borsh_string(data, offset):
+    (length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    value = data[offset:offset + length].decode("utf-8", "replace")
+    return value.rstrip("\0").strip(), offset + length
+
+
+def decode_metadata(data):
+    '''(name, symbol) from a metaplex metadata account
+
+    Layout: key u8, update authority [32], mint [32], then borsh strings
+    name, symbol and uri, padded with NULs by the program.
+    '''
+    try:
+        offset = 1 + 32 + 32
+        name, offset = _borsh_string(data, offset)
+        symbol, offset = _borsh_string(data, offset)
+    except (struct.error, IndexError):
+        return None, None
+    return name or None, symbol or None
@@ -0,0 +1,165 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from metrics import metrics, log
+
+
+# look-alike characters folded onto the latin letter they imitate
+CONFUSABLES = str.maketrans({
+    # cyrillic
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j",
+    "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ү": "y",
+    # greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ω": "w",
+    # digits and signs used as letters
+    "0": "o", "1": "l", "3": "e", "5": "s", "$": "s", "@": "a", "₮": "t",
+    "€": "e", "¢": "c", "ł": "l", "ø": "o", "đ": "d", "ı": "i",
+})
+
+# names and symbols that advertise a link or a giveaway are spam outright
+SPAM_PATTERN = re.compile(
+    r"https?:|www\.|\bt\.me\b"
+    r"|\b(claim|airdrop|visit|voucher|giveaway)\b", re.I)
+# a bare domain is only spam on a token that also imitates a reference;
+# plenty of real names carry one ("Crypto.com Coin", "yearn.finance")
+SITE_PATTERN = re.compile(r"\.(com|io|org|net|xyz|app|finance|site)\b", re.I)
+
+
+COMBINING = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+NOT_ALNUM = re.compile(r"[\W_]+")
+
+
+@lru_cache(maxsize=1 << 16)
+def skeleton(text):
+    '''what `text` looks like: case, accents, look-alikes and punctuation folded'''
+    text = (text or "").lower()
+    if not text.isascii():
+        text = COMBINING.sub("", unicodedata.normalize("NFKD", text))
+    text = text.translate(CONFUSABLES).replace("rn", "m").replace("vv", "w")
+    return NOT_ALNUM.sub("", text)
+
+
+def trigrams(text):
+    text = f"  {text} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def similarity(a, b):
+    '''jaccard similarity of two trigram sets'''
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class Reference(object):
+    __slots__ = ("address", "symbol", "name", "name_grams")
+
+    def __init__(self, token):
+        self.address = token["address"].lower()
+        self.symbol = (token.get("symbol") or "").casefold()
+        self.name = skeleton(token.get("name"))
+        self.name_grams = trigrams(self.name)
+
+
+class SpamFilter(object):
+    '''scores tokens of one chain for impersonating well-known ones
+
+    The reference set is the chain's `top_n` tokens by market cap plus the
+    ones OneKey lists itself. References are bucketed by the skeleton of
+    their symbol and of their name, so each candidate is compared only with
+    the few references it could be mistaken for:
+
+        symbol skeleton matches   0.6, plus 0.3 x name trigram similarity,
+                                  plus 0.1 when the raw symbols differ
+                                  (look-alike characters, punctuation)
+        name skeleton matches     0.7
+        either, with a domain     1.0
+        link or giveaway name     1.0
+
+    A token at `drop` or above is removed, at `flag` or above it is logged.
+    Coingecko-listed and OneKey tokens are never scored.
+    '''
+
+    trusted_sources = ("coingecko", "onekey")
+
+    def __init__(self, tokens, market_caps, top_n=500, flag=0.6, drop=0.8):
+        self.flag = flag
+        self.drop = drop
+        ranked = sorted(
+            (t for t in tokens if (market_caps.get(t["address"].lower()) or 0) > 0),
+            key=lambda t: market_caps[t["address"].lower()], reverse=True)[:top_n]
+        references = ranked + [
+            t for t in tokens if "onekey" in t.get("extensions", {}).get("source", [])]
+
+        self.by_symbol = {}
+        self.by_name = {}
+        for token in references:
+            ref = Reference(token)
+            symbol = skeleton(token.get("symbol"))
+            if symbol:
+                self.by_symbol.setdefault(symbol, []).append(ref)
+            if len(ref.name) >= 4:
+                self.by_name.setdefault(ref.name, []).append(ref)
+
+    def trusted(self, token):
+        sources = token.get("extensions", {}).get("source", [])
+        return any(s in self.trusted_sources for s in sources)
+
+    def score(self, token):
+        '''(score, address of the reference it imitates or None)'''
+        name = token.get("name") or ""
+        symbol = token.get("symbol") or ""
+        if SPAM_PATTERN.search(f"{name}\n{symbol}"):
+            return 1.0, None
+
+        address = token["address"].lower()
+        best = (0.0, None)
+        refs = self.by_symbol.get(skeleton(symbol))
+        if refs:
+            name_grams = trigrams(skeleton(name))
+            for ref in refs:
+                if ref.address == address:
+                    return 0.0, None
+                score = 0.6 + 0.3 * similarity(name_grams, ref.name_grams) + \
+                    (0.1 if symbol.casefold() != ref.symbol else 0.0)
+                if score > best[0]:
+                    best = (score, ref.address)
+        for ref in self.by_name.get(skeleton(name), []):
+            if ref.address == address:
+                return 0.0, None
+            if 0.7 > best[0]:
+                best = (0.7, ref.address)
+        if best[1] is not None and SITE_PATTERN.search(f"{name}\n{symbol}"):
+            return 1.0, best[1]
+        return best
+
+    def filter(self, chain, tokens):
+        '''the tokens that are not dropped, logging the flagged ones'''
+        kept = []
+        flagged = dropped = 0
+        for token in tokens:
+            if self.trusted(token):
+                kept.append(token)
+                continue
+            score, imitates = self.score(token)
+            if score >= self.drop:
+                dropped += 1
+                log(f"  - {chain} {token['address']} {token.get('symbol')!r} dropped as spam "
+                    f"({score:.2f}, imitates {imitates})")
+                continue
+            if score >= self.flag:
+                flagged += 1
+                log(f"  - {chain} {token['address']} {token.get('symbol')!r} looks like "
+                    f"{imitates} ({score:.2f})")
+            kept.append(token)
+        metrics.count_tokens(chain, "spam_flagged", flagged)
+        metrics.count_tokens(chain, "spam_dropped", dropped)
+        return kept
+
+
+def filter_spam(chain, tokens, market_caps, **kwargs):
+    '''drop likely impersonators from the merged tokens of `chain`'''
+    return SpamFilter(tokens, market_caps, **kwargs).filter(chain, tokens)
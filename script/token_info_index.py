@@ -0,0 +1,266 @@
+'''sharded binary index of token_info metadata
+
+One shard per chainId, `<dir>/<chainId>.idx`, laid out as
+
+    header   magic, count, entries offset, keys offset, strings offset
+    entries  count x (key_off u32, key_len u16, val_off u32, val_len u16),
+             sorted by key bytes
+    keys     address keys; 0x-hex addresses as 20 raw bytes behind a 0x01
+             tag (so lookups ignore checksum case), others utf-8 behind 0x02
+    strings  compact json [address, impl, name, symbol, decimals]
+
+Shards are memory-mapped on first use and searched by bisection, so a
+lookup costs O(log n) with nothing parsed up front.
+
+    python3 script/token_info_index.py build token_info.json token_info.idx
+    python3 script/token_info_index.py dump token_info.idx token_info.json
+'''
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from artifacts import write_atomic
+from journal import JournaledDict
+
+
+MAGIC = b"TKI1"
+HEADER = struct.Struct("<4sIIII")
+ENTRY = struct.Struct("<IHIH")
+
+
+def encode_key(address):
+    if address[:2].lower() == "0x":
+        try:
+            return b"\x01" + bytes.fromhex(address[2:])
+        except ValueError:
+            pass
+    return b"\x02" + address.encode("utf-8")
+
+
+def split_token_id(token_id):
+    '''`chainId--address` -> (chainId, address)'''
+    chain_id, _, address = token_id.partition("--")
+    return chain_id, address
+
+
+def write_shard(path, infos):
+    '''write one shard from {address: info}'''
+    rows = sorted((encode_key(address), address, info)
+                  for address, info in infos.items())
+    keys = bytearray()
+    strings = bytearray()
+    entries = bytearray()
+    for key, address, info in rows:
+        impl = info.get("id", "").split("--")[0]
+        value = json.dumps([address, impl, info.get("name"), info.get("symbol"),
+                            info.get("decimals")], separators=(",", ":")).encode("utf-8")
+        entries += ENTRY.pack(len(keys), len(key), len(strings), len(value))
+        keys += key
+        strings += value
+
+    entries_off = HEADER.size
+    keys_off = entries_off + len(entries)
+    strings_off = keys_off + len(keys)
+    write_atomic(path, HEADER.pack(MAGIC, len(rows), entries_off, keys_off, strings_off)
+                 + entries + keys + strings)
+
+
+class Shard(object):
+    '''read-only view of one memory-mapped shard'''
+
+    def __init__(self, path):
+        self.chain_id = os.path.basename(path)[:-len(".idx")]
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.entries_off, self.keys_off, self.strings_off = \
+            HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a token info index shard")
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self.mm, self.entries_off + i * ENTRY.size)
+
+    def _key(self, entry):
+        start = self.keys_off + entry[0]
+        return self.mm[start:start + entry[1]]
+
+    def _value(self, entry):
+        start = self.strings_off + entry[2]
+        address, impl, name, symbol, decimals = json.loads(
+            self.mm[start:start + entry[3]])
+        return address, dict(id=f"{impl}--{self.chain_id}--{address}",
+                             name=name, symbol=symbol, decimals=decimals)
+
+    def get(self, address):
+        key = encode_key(address)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(self._entry(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            entry = self._entry(lo)
+            if self._key(entry) == key:
+                return self._value(entry)[1]
+        return None
+
+    def items(self):
+        for i in range(self.count):
+            yield self._value(self._entry(i))
+
+    def close(self):
+        self.mm.close()
+
+
+class TokenInfoIndex(object):
+    '''token_info lookups served from the shards in `dir`'''
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.shards = {}
+        self.lock = threading.Lock()
+
+    def shard(self, chain_id):
+        with self.lock:
+            if chain_id not in self.shards:
+                path = os.path.join(self.dir, f"{chain_id}.idx")
+                self.shards[chain_id] = Shard(
+                    path) if os.path.exists(path) else None
+            return self.shards[chain_id]
+
+    def chain_ids(self):
+        if not os.path.isdir(self.dir):
+            return []
+        return sorted(f[:-len(".idx")] for f in os.listdir(self.dir) if f.endswith(".idx"))
+
+    def get(self, token_id, default=None):
+        chain_id, address = split_token_id(token_id)
+        shard = self.shard(chain_id)
+        if shard is None:
+            return default
+        info = shard.get(address)
+        return default if info is None else info
+
+    def __contains__(self, token_id):
+        return self.get(token_id) is not None
+
+    def items(self):
+        for chain_id in self.chain_ids():
+            for address, info in self.shard(chain_id).items():
+                yield f"{chain_id}--{address}", info
+
+    def close(self):
+        with self.lock:
+            for shard in self.shards.values():
+                if shard is not None:
+                    shard.close()
+            self.shards = {}
+
+    def write_chain(self, chain_id, infos):
+        '''replace the shard of `chain_id` with {address: info}'''
+        os.makedirs(self.dir, exist_ok=True)
+        with self.lock:
+            shard = self.shards.pop(chain_id, None)
+            if shard is not None:
+                shard.close()
+        write_shard(os.path.join(self.dir, f"{chain_id}.idx"), infos)
+
+
+class IndexedTokenInfo(object):
+    '''drop-in for the token_info dict in check_fix backed by the index
+
+    New entries go to a journaled overlay (`<dir>/overlay.json`) and are
+    merged into the shards they belong to on `close()`.
+    '''
+
+    def __init__(self, dir):
+        self.index = TokenInfoIndex(dir)
+        os.makedirs(dir, exist_ok=True)
+        self.overlay = JournaledDict(os.path.join(dir, "overlay.json"))
+
+    def get(self, token_id, default=None):
+        info = self.overlay.get(token_id)
+        if info is not None:
+            return info
+        return self.index.get(token_id, default)
+
+    def __getitem__(self, token_id):
+        info = self.get(token_id)
+        if info is None:
+            raise KeyError(token_id)
+        return info
+
+    def __setitem__(self, token_id, info):
+        self.overlay[token_id] = info
+
+    def update(self, infos):
+        self.overlay.update(infos)
+
+    def __contains__(self, token_id):
+        return self.get(token_id) is not None
+
+    def flush(self):
+        '''fold the overlay into the shards it touches'''
+        pending = {}
+        for token_id, info in self.overlay.items():
+            chain_id, address = split_token_id(token_id)
+            pending.setdefault(chain_id, {})[address] = info
+        for chain_id, infos in pending.items():
+            shard = self.index.shard(chain_id)
+            merged = dict(shard.items()) if shard is not None else {}
+            merged.update(infos)
+            self.index.write_chain(chain_id, merged)
+        self.overlay.clear()
+        self.overlay.compact()
+
+    def close(self):
+        if len(self.overlay) > 0:
+            self.flush()
+        self.overlay.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_index(json_path, dir):
+    '''convert a token_info.json snapshot into index shards'''
+    with open(json_path) as f:
+        token_info = json.load(f)
+    chains = {}
+    for token_id, info in token_info.items():
+        chain_id, address = split_token_id(token_id)
+        chains.setdefault(chain_id, {})[address] = info
+    index = TokenInfoIndex(dir)
+    for chain_id, infos in chains.items():
+        index.write_chain(chain_id, infos)
+    return len(token_info)
+
+
+def dump_index(dir, json_path):
+    '''convert index shards back into a token_info.json snapshot'''
+    index = TokenInfoIndex(dir)
+    token_info = dict(index.items())
+    index.close()
+    with open(json_path, "w") as f:
+        f.write(json.dumps(token_info, sort_keys=True, indent=2))
+        f.write("\n")
+    return len(token_info)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("build", "dump"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "build":
+        print(f"indexed {build_index(sys.argv[2], sys.argv[3])} tokens")
+    else:
+        print(f"dumped {dump_index(sys.argv[2], sys.argv[3])} tokens")
@@ -0,0 +1,122 @@
+import threading
+
+
+def normalize_address(address):
+    '''hex addresses compare case-insensitively, everything else verbatim'''
+    address = address.strip()
+    if address[:2].lower() == "0x":
+        return address.lower()
+    return address
+
+
+class TokenRecord(object):
+    '''one token of one chain, merged from every source that lists it'''
+
+    __slots__ = ("chain", "chainId", "address", "symbol", "name", "decimals",
+                 "logoURI", "sources", "priority", "seq")
+
+    fields = ("symbol", "name", "decimals", "logoURI")
+
+    def __init__(self, chain, token, priority, seq):
+        self.chain = chain
+        self.chainId = token.get("chainId")
+        self.address = token["address"]
+        self.symbol = token.get("symbol")
+        self.name = token.get("name")
+        self.decimals = token.get("decimals")
+        self.logoURI = token.get("logoURI") or None
+        self.sources = list(token.get("extensions", {}).get("source", []))
+        self.priority = priority
+        self.seq = seq
+
+    def merge(self, token, priority):
+        '''fold another listing of the same token into this record
+
+        Fields come from the listing with the lowest priority value (the
+        earliest one on ties); gaps are filled from the others. Sources keep
+        the order they were first seen in.
+        '''
+        takes_over = priority < self.priority
+        if takes_over:
+            self.address = token["address"]
+            self.chainId = token.get("chainId", self.chainId)
+            self.priority = priority
+        for field in self.fields:
+            value = token.get(field)
+            if value is None or value == "":
+                continue
+            if takes_over or getattr(self, field) is None:
+                setattr(self, field, value)
+        for source in token.get("extensions", {}).get("source", []):
+            if source not in self.sources:
+                self.sources.append(source)
+
+    def to_dict(self):
+        token = dict(
+            chainId=self.chainId,
+            address=self.address,
+            symbol=self.symbol,
+            name=self.name,
+            extensions=dict(source=list(self.sources)),
+        )
+        if self.decimals is not None:
+            token["decimals"] = self.decimals
+        if self.logoURI is not None:
+            token["logoURI"] = self.logoURI
+        return token
+
+
+class TokenStore(object):
+    '''index of tokens across all networks keyed on (chain, address)
+
+    `chain` is the network id from chain.json (e.g. `evm--56`), since bare
+    chainIds collide between impls. Upserts are O(1); `tokens()` returns a
+    chain's tokens ordered by the priority of the winning listing, then by
+    first insertion.
+    '''
+
+    def __init__(self):
+        self.records = {}
+        self.chains = {}
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def upsert(self, chain, token, priority=0):
+        address = token.get("address")
+        if not address:  # No address
+            return None
+        key = (chain, normalize_address(address))
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                record = TokenRecord(chain, token, priority, self.seq)
+                self.seq += 1
+                self.records[key] = record
+                self.chains.setdefault(chain, []).append(record)
+            else:
+                record.merge(token, priority)
+        return record
+
+    def extend(self, chain, tokens, priority=0):
+        '''upsert every token, returning how many were given'''
+        count = 0
+        for token in tokens:
+            self.upsert(chain, token, priority)
+            count += 1
+        return count
+
+    def get(self, chain, address):
+        return self.records.get((chain, normalize_address(address)))
+
+    def __contains__(self, key):
+        chain, address = key
+        return (chain, normalize_address(address)) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def tokens(self, chain):
+        with self.lock:
+            records = list(self.chains.get(chain, []))
+        records.sort(key=lambda r: (r.priority, r.seq))
+        return [r.to_dict() for r in records]
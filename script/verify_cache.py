@@ -0,0 +1,87 @@
+import threading
+import time
+
+from journal import JournaledDict
+from metrics import metrics
+
+
+OK = "ok"
+INVALID = "invalid"
+ERROR = "error"
+
+# seconds an outcome is trusted before the token is looked up again
+DEFAULT_TTLS = {
+    OK: 30 * 24 * 3600,
+    INVALID: 7 * 24 * 3600,
+    ERROR: 3600,
+}
+
+
+class VerificationCache(object):
+    '''remembers how each token's on-chain verification turned out
+
+    Entries are keyed on `impl--chainId--address` and record the outcome
+    (`ok`, `invalid` or `error`), when it was fetched and, where the rpc
+    reports it, the block height. An outcome younger than its TTL lets
+    `check_tokens` skip the network entirely, so known-bad tokens from
+    third-party lists cost nothing on later runs. Expired and least recently
+    used entries beyond `max_entries` are evicted on `close()`.
+    '''
+
+    def __init__(self, path="./.cache/verify_cache.json", ttls=None, max_entries=200000):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        # it's a cache: losing the tail of the journal on power loss is fine
+        self.entries = JournaledDict(path, fsync=False)
+        self.lock = threading.Lock()
+
+    def lookup(self, id, now=None):
+        '''the outcome recorded for `id` if it is still fresh, else None'''
+        entry = self.entries.get(id)
+        now = now or time.time()
+        if entry is None or now - entry.get("fetched_at", 0) >= self.ttls.get(entry.get("status"), 0):
+            metrics.cache("verify", False)
+            return None
+        metrics.cache("verify", True)
+        # persisted with the next compaction, no journal write per hit
+        entry["used_at"] = now
+        return entry.get("status")
+
+    def __contains__(self, id):
+        return id in self.entries
+
+    def record(self, id, status, block=None, now=None):
+        now = now or time.time()
+        self.entries[id] = dict(status=status, fetched_at=now,
+                                used_at=now, block=block)
+
+    def evict(self, now=None):
+        '''drop expired entries, then the least recently used over the cap'''
+        now = now or time.time()
+        with self.lock:
+            expired = [
+                id for id, entry in self.entries.items()
+                if now - entry.get("fetched_at", 0) >= self.ttls.get(entry.get("status"), 0)
+            ]
+            for id in expired:
+                dict.pop(self.entries, id, None)
+
+            overflow = len(self.entries) - self.max_entries
+            if overflow > 0:
+                by_use = sorted(self.entries.items(),
+                                key=lambda item: item[1].get("used_at", 0))
+                for id, _ in by_use[:overflow]:
+                    dict.pop(self.entries, id, None)
+            # the snapshot no longer has the evicted ids and the journal is
+            # dropped, so they stay gone
+            self.entries.compact()
+
+    def close(self):
+        self.evict()
+        self.entries.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,53 @@
+'''release artifacts against a previous release
+
+    python3 -m pytest test
+'''
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from artifacts import write_artifacts  # noqa: E402
+
+
+OLD = dict(major=0, minor=0, patch=1)
+TOKEN = dict(chainId=1, address="0x1", name="One", symbol="ONE", decimals=18)
+
+
+def token_list(tokens, timestamp="2026-01-01T00:00:00.000Z", version=OLD):
+    return dict(name="OneKey", timestamp=timestamp, version=version, tokens=tokens)
+
+
+def release(tmp_path, lists, version="0.0.2"):
+    previous = tmp_path / "previous"
+    previous.mkdir(exist_ok=True)
+    with open(previous / "evm.all.json", "w") as f:
+        json.dump(token_list([TOKEN]), f)
+    dir = tmp_path / "build"
+    write_artifacts(str(dir), ["evm.all"], previous_dir=str(previous),
+                    lists=dict((f"{impl}.all", list) for impl, list in lists.items()),
+                    version=version)
+    with open(dir / "manifest.json") as f:
+        manifest = json.load(f)
+    with open(dir / "evm.all.json") as f:
+        return json.load(f), manifest["lists"]["evm"]
+
+
+def test_unchanged_list_keeps_the_previous_release(tmp_path):
+    list, entry = release(tmp_path, dict(evm=token_list([TOKEN], "2026-02-01T00:00:00.000Z",
+                                                        dict(major=0, minor=0, patch=2))))
+    assert (list["timestamp"], list["version"]) == ("2026-01-01T00:00:00.000Z", OLD)
+    assert "delta" not in entry
+
+
+def test_list_changed_after_the_build_gets_a_new_release(tmp_path):
+    # build kept the previous timestamp and version, then check_fix pruned a token
+    list, entry = release(tmp_path, dict(evm=token_list([])))
+    assert list["timestamp"] != "2026-01-01T00:00:00.000Z"
+    assert list["version"] == dict(major=0, minor=0, patch=2)
+    with open(tmp_path / "build" / entry["delta"]["file"]) as f:
+        delta = json.load(f)
+    assert delta["base"]["version"] == OLD
+    assert delta["target"]["version"] == list["version"]
+    assert delta["removed"] == [dict(chainId=1, address="0x1")]
@@ -0,0 +1,57 @@
+'''JournaledDict snapshot and journal replay
+
+    python3 -m pytest test
+'''
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from journal import JournaledDict  # noqa: E402
+
+
+def test_replays_the_journal(tmp_path):
+    path = str(tmp_path / "cache.json")
+    d = JournaledDict(path, fsync=False)
+    d["a"] = 1
+    d.update(b=dict(x=[1, 2]), c="three")
+    del d["c"]
+    # an interrupted run: nothing compacted
+    assert not os.path.exists(path)
+    assert JournaledDict(path, fsync=False) == dict(a=1, b=dict(x=[1, 2]))
+
+
+def test_torn_last_line(tmp_path):
+    path = str(tmp_path / "cache.json")
+    d = JournaledDict(path, fsync=False)
+    d["a"] = 1
+    d["b"] = 2
+    with open(d.journal_path, "a") as f:
+        # killed in the middle of a write
+        f.write(json.dumps(dict(k="c", v=3))[:-4])
+
+    d = JournaledDict(path, fsync=False)
+    assert d == dict(a=1, b=2)
+    # the next entry starts on a line of its own
+    d["d"] = 4
+    assert JournaledDict(path, fsync=False) == dict(a=1, b=2, d=4)
+    with open(d.journal_path) as f:
+        lines = f.read().split("\n")
+    assert json.loads(lines[-2]) == dict(k="d", v=4)
+
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "cache.json")
+    with JournaledDict(path, fsync=False) as d:
+        d["b"] = 2
+        d["a"] = 1
+    assert not os.path.exists(d.journal_path)
+    with open(path) as f:
+        assert json.load(f) == dict(a=1, b=2)
+    d = JournaledDict(path, compact_bytes=64, fsync=False)
+    for i in range(10):
+        d[f"k{i}"] = i
+    # compacted on the way, the rest replayed from the journal
+    assert os.path.getsize(d.journal_path) < 64
+    assert JournaledDict(path, fsync=False) == dict(a=1, b=2, **{f"k{i}": i for i in range(10)})
@@ -0,0 +1,67 @@
+'''iter_items against json.loads, over chunk boundaries anywhere
+
+    python3 -m pytest test
+'''
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from json_stream import iter_items  # noqa: E402
+
+
+TOKENS = [
+    dict(chainId=1, address="0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48", name="USD Coin",
+         symbol="USDC", decimals=6, price=1.0001, change=-2.5e-3, tags=[]),
+    dict(chainId=56, address="0x55d398326f99059ff775485246999027b3197955",
+         name='Tether "USD" \\ é漢😀', symbol="USDT\n\t", decimals=18,
+         logoURI=None, verified=True, spam=False, extensions={"bridge": {"1": "0x0"}}),
+    12345678901234567890,
+    -0.5,
+    1e100,
+    True,
+    None,
+    "a \"quoted\" \\/ string",
+    [],
+    {},
+]
+
+DOCUMENTS = [
+    ("", TOKENS),
+    ("tokens", dict(name="list", version=dict(major=1, minor=2, patch=3),
+                    keywords=["a", "b"], count=1.5, ok=True, none=None, tokens=TOKENS)),
+    ("data.tokens", dict(skipped=[1, 2.25, [False]], data=dict(
+        before="\\]}", tokens=TOKENS, after=[None]))),
+]
+
+
+def expected(document, path):
+    for key in [k for k in path.split(".") if k]:
+        document = document[key]
+    return document
+
+
+@pytest.mark.parametrize("path, document", DOCUMENTS)
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_matches_json_loads(path, document, indent, chunk_size):
+    data = json.dumps(document, indent=indent, ensure_ascii=False).encode("utf-8")
+    items = list(iter_items(io.BytesIO(data), path, chunk_size=chunk_size))
+    assert items == expected(json.loads(data), path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_missing_path(chunk_size):
+    data = json.dumps(dict(data=dict(other=[1]), list=[])).encode()
+    for path in ["tokens", "data.tokens", "list.tokens", "data.other.x"]:
+        assert list(iter_items(io.BytesIO(data), path, chunk_size=chunk_size)) == []
+
+
+def test_truncated_document():
+    data = json.dumps(TOKENS).encode()[:-10]
+    with pytest.raises(ValueError):
+        list(iter_items(io.BytesIO(data), chunk_size=7))
@@ -0,0 +1,121 @@
+'''logo validation against a stub image server on localhost
+
+    python3 -m pytest test
+'''
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from logo_check import BROKEN, ERROR, OK, LogoValidator, validate_logos  # noqa: E402
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+PNG_ETAG = '"%s"' % hashlib.sha256(PNG).hexdigest()[:16]
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"", content_type="image/png", etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.path in ("/logo.png", "/same.png"):
+            if self.headers.get("If-None-Match") == PNG_ETAG:
+                return self.reply(304, etag=PNG_ETAG)
+            return self.reply(200, PNG, etag=PNG_ETAG)
+        if self.path == "/page.png":
+            return self.reply(200, b"<html></html>", "text/html")
+        if self.path == "/empty.png":
+            return self.reply(200, b"")
+        if self.path == "/busy.png":
+            return self.reply(503, b"busy", "text/plain")
+        self.reply(404, b"not found", "text/plain")
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    server.hits = []
+    server.base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def validator(tmp_path):
+    validator = LogoValidator(path=str(tmp_path / "logo_cache.json"), workers=4,
+                              mirror_dir=str(tmp_path / "mirror"))
+    yield validator
+    validator.close()
+
+
+def test_statuses(server, validator):
+    results = validator.check_all(f"{server.base}/{name}" for name in [
+        "logo.png", "missing.png", "page.png", "empty.png", "busy.png"])
+    statuses = dict((url.rsplit("/", 1)[1], entry["status"]) for url, entry in results.items())
+    assert statuses == {"logo.png": OK, "missing.png": BROKEN, "page.png": BROKEN,
+                        "empty.png": BROKEN, "busy.png": ERROR}
+    entry = results[f"{server.base}/logo.png"]
+    assert entry["sha256"] == hashlib.sha256(PNG).hexdigest()
+    assert entry["etag"] == PNG_ETAG
+
+
+def test_cached_and_revalidated(server, validator):
+    url = f"{server.base}/logo.png"
+    first = validator.check(url, now=1000)
+    # fresh: answered from the cache
+    assert validator.check(url, now=2000) == first
+    assert len(server.hits) == 1
+    # stale: a conditional request, and the 304 keeps the entry
+    later = 1000 + validator.ttls[OK] + 1
+    entry = validator.check(url, now=later)
+    assert server.hits[-1] == ("/logo.png", PNG_ETAG)
+    assert entry["status"] == OK and entry["sha256"] == first["sha256"]
+    assert entry["fetched_at"] == later
+
+
+def test_mirror_keeps_one_copy(server, validator, tmp_path):
+    results = validator.check_all([f"{server.base}/logo.png", f"{server.base}/same.png"])
+    paths = set(validator.mirror_path(entry) for entry in results.values())
+    assert len(paths) == 1
+    with open(tmp_path / "mirror" / paths.pop(), "rb") as f:
+        assert f.read() == PNG
+
+
+def test_validate_logos_leaves_the_tokens_alone(server, validator):
+    ok = dict(address="0x1", logoURI=f"{server.base}/logo.png")
+    broken = dict(address="0x2", logoURI=f"{server.base}/missing.png")
+    busy = dict(address="0x3", logoURI=f"{server.base}/busy.png")
+    bare = dict(address="0x4")
+    impl_list = dict(evm=[ok, broken, busy, bare])
+
+    validate_logos(impl_list, validator, mirror_url="https://cdn.example/logos/")
+    tokens = dict((t["address"], t) for t in impl_list["evm"])
+    assert tokens["0x1"]["logoURI"] == \
+        f"https://cdn.example/logos/{validator.mirror_path(validator.entries[ok['logoURI']])}"
+    assert "logoURI" not in tokens["0x2"]
+    # errors keep their logo until the next check
+    assert tokens["0x3"]["logoURI"] == busy["logoURI"]
+    assert tokens["0x4"] == bare
+    # the originals, which incremental builds keep, still carry the upstream urls
+    assert ok["logoURI"] == f"{server.base}/logo.png"
+    assert broken["logoURI"] == f"{server.base}/missing.png"
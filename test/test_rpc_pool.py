@@ -0,0 +1,152 @@
+'''endpoint failover against stub json-rpc servers on localhost
+
+    python3 -m pytest test
+'''
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from rpc_pool import EndpointError, EndpointPool, check_batch  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.hits += 1
+        if self.path.startswith("/missing"):
+            return self.reply(404, dict(message="not found"))
+        return self.reply(200, dict(path=self.path))
+
+    def do_POST(self):
+        self.server.hits += 1
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        mode = self.server.mode
+        if mode == "down":
+            return self.reply(502, dict(message="bad gateway"))
+        if mode == "reject_batch" and isinstance(payload, list):
+            return self.reply(200, dict(jsonrpc="2.0", id=None, error=dict(
+                code=-32600, message="batch limit 100 exceeded")))
+        items = payload if isinstance(payload, list) else [payload]
+        replies = []
+        for item in items:
+            if mode == "rate_limited":
+                replies.append(dict(jsonrpc="2.0", id=item["id"], error=dict(
+                    code=-32005, message="daily request count exceeded")))
+            elif item["method"] == "eth_getBalance":
+                replies.append(dict(jsonrpc="2.0", id=item["id"], error=dict(
+                    code=-32602, message="invalid argument 0: hex string has length 2")))
+            else:
+                replies.append(dict(jsonrpc="2.0", id=item["id"], result=self.server.name))
+        self.reply(200, replies if isinstance(payload, list) else replies[0])
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(name, mode="ok"):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.name = name
+        server.mode = mode
+        server.hits = 0
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def pool_of(*servers):
+    # unmeasured endpoints keep their order, so the first one is tried first
+    return EndpointPool([
+        dict(url=f"http://127.0.0.1:{s.server_port}", rate=1000, burst=1000)
+        for s in servers
+    ], timeout=5)
+
+
+def call(method="eth_blockNumber", id=1):
+    return dict(jsonrpc="2.0", method=method, id=id, params=[])
+
+
+def test_fails_over_on_http_errors(servers):
+    down, up = servers("a", "down"), servers("b")
+    pool = pool_of(down, up)
+    assert pool.post(call())["result"] == "b"
+    assert (down.hits, up.hits) == (1, 1)
+    stats = dict((s["url"], s) for s in pool.stats())
+    assert stats[pool.endpoints[0].url]["error_rate"] == 1.0
+    assert stats[pool.endpoints[1].url]["error_rate"] == 0.0
+
+
+def test_fails_over_on_rate_limit_errors(servers):
+    throttled, up = servers("a", "rate_limited"), servers("b")
+    pool = pool_of(throttled, up)
+    assert pool.post(call())["result"] == "b"
+    assert [item["result"] for item in pool.post(
+        [call(id=1), call(id=2)], check_batch)] == ["b", "b"]
+    # benched after the first failure, so the batch went straight to b
+    assert throttled.hits == 1
+    assert pool.endpoints[0].error_rate() == 1.0
+
+
+def test_fails_over_on_a_rejected_batch(servers):
+    strict, lenient = servers("a", "reject_batch"), servers("b")
+    pool = pool_of(strict, lenient)
+    replies = pool.post([call(id=1), call(id=2)], check_batch)
+    assert [item["result"] for item in replies] == ["b", "b"]
+    assert strict.hits == 1
+
+
+def test_every_endpoint_rejecting_a_batch(servers):
+    pool = pool_of(servers("a", "reject_batch"), servers("b", "reject_batch"))
+    with pytest.raises(EndpointError) as e:
+        pool.post([call(id=1), call(id=2)], check_batch)
+    # callers may split the batch and try again
+    assert e.value.rejected
+
+
+def test_every_endpoint_down(servers):
+    pool = pool_of(servers("a", "down"), servers("b", "down"))
+    with pytest.raises(EndpointError) as e:
+        pool.post(call())
+    assert not e.value.rejected
+
+
+def test_keeps_errors_about_the_request(servers):
+    first, second = servers("a"), servers("b")
+    pool = pool_of(first, second)
+    # a node's answer about the call itself is not a reason to fail over
+    reply = pool.post(call("eth_getBalance"))
+    assert reply["error"]["code"] == -32602
+    assert (first.hits, second.hits) == (1, 0)
+    assert pool.endpoints[0].error_rate() == 0.0
+
+
+def test_rest_get(servers):
+    server = servers("a")
+    pool = pool_of(server)
+    assert pool.get("/assets/1") == dict(path="/assets/1")
+    # 404 is an answer: no retry, no failure recorded
+    assert pool.get("/missing/1") is None
+    assert server.hits == 2
+    assert pool.endpoints[0].error_rate() == 0.0
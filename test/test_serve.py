@@ -0,0 +1,79 @@
+'''the query server over a small build
+
+    python3 -m pytest test
+'''
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from artifacts import write_artifacts  # noqa: E402
+from serve import MAX_LIMIT, TokenServer  # noqa: E402
+
+
+TOKENS = [
+    dict(chainId=1, address=f"0x{i:040x}", name=f"Token {i}", symbol=f"T{i}", decimals=18)
+    for i in range(1, 8)
+] + [dict(chainId=56, address="0x" + "b" * 40, name="Bee", symbol="BEE", decimals=18)]
+
+
+@pytest.fixture
+def server(tmp_path):
+    dir = tmp_path / "build"
+    write_artifacts(str(dir), ["evm.all"], previous_dir=str(tmp_path / "previous"), lists={
+        "evm.all": dict(name="OneKey", timestamp="2026-01-01T00:00:00.000Z",
+                        version=dict(major=0, minor=0, patch=1), tokens=TOKENS)})
+    server = TokenServer(("127.0.0.1", 0), str(dir), reload_interval=0)
+    server.base = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, etag=None):
+    request = urllib.request.Request(server.base + path)
+    if etag:
+        request.add_header("If-None-Match", etag)
+    try:
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            return response.status, response.headers.get("ETag"), \
+                json.loads(body) if body else None
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        return e.code, e.headers.get("ETag"), json.loads(body) if body else None
+
+
+def test_token_and_revalidation(server):
+    status, etag, token = get(server, "/tokens/1/0x" + "0" * 39 + "3")
+    assert status == 200 and token["symbol"] == "T3"
+    assert get(server, "/tokens/1/0x" + "0" * 39 + "3", etag)[0] == 304
+
+
+def test_not_found_ignores_if_none_match(server):
+    etag = server.snapshot.etag
+    status, reply_etag, body = get(server, "/tokens/1/0x" + "f" * 40, etag)
+    assert (status, reply_etag) == (404, None)
+    assert body == dict(error="token not found")
+    assert get(server, "/nowhere", etag)[0] == 404
+
+
+def test_chain_pages(server):
+    _, _, page = get(server, "/tokens/1?offset=2&limit=3")
+    assert page["total"] == 7
+    assert [t["symbol"] for t in page["tokens"]] == ["T3", "T4", "T5"]
+
+
+@pytest.mark.parametrize("limit, count", [(-5, 1), (0, 1), (MAX_LIMIT * 10, 7)])
+def test_limit_is_clamped(server, limit, count):
+    _, _, page = get(server, f"/tokens/1?limit={limit}")
+    assert len(page["tokens"]) == count
+    _, _, found = get(server, f"/search?q=token&limit={limit}")
+    assert len(found["tokens"]) == count
@@ -0,0 +1,217 @@
+'''token managers against recorded rpc and rest replies
+
+    python3 -m pytest test
+'''
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "script"))
+
+from check_fix import (AlgoTokenManager, CfxTokenManager, CosmosTokenManager,  # noqa: E402
+                       InvalidContractError, NearTokenManager, StcTokenManager)
+from rpc_pool import EndpointError  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FixturePool(object):
+    '''stands in for rpc_pool.EndpointPool, answering from a fixture file
+
+    JSON-RPC requests are matched on method and params and get the recorded
+    reply with the request's id. REST requests are matched on path, params
+    and base; a 404 is None and any other error status an EndpointError,
+    as the pool returns them. Batches longer than `max_batch` get the
+    whole-batch error a node answers them with.
+    '''
+
+    batch_limit = 100
+
+    def __init__(self, name):
+        with open(os.path.join(FIXTURES, f"{name}.json")) as f:
+            fixture = json.load(f)
+        self.rpc = fixture.get("rpc", [])
+        self.rest = fixture.get("rest", [])
+        self.batch_error = None
+        self.max_batch = None
+        self.batches = []
+
+    def post(self, jsonrpc_data, validate=None):
+        if isinstance(jsonrpc_data, list):
+            self.batches.append(len(jsonrpc_data))
+            body = self.batch_error
+            if self.max_batch is not None and len(jsonrpc_data) > self.max_batch:
+                body = dict(jsonrpc="2.0", id=None, error=dict(
+                    code=-32600, message=f"batch limit {self.max_batch} exceeded"))
+            if body is None:
+                body = [self.reply(item) for item in jsonrpc_data]
+        else:
+            body = self.reply(jsonrpc_data)
+        if validate is not None:
+            validate(body)
+        return body
+
+    def reply(self, item):
+        for exchange in self.rpc:
+            request = exchange["request"]
+            if request["method"] == item["method"] and request["params"] == item["params"]:
+                return dict(exchange["response"], id=item["id"])
+        raise AssertionError(f"no recorded reply for {item}")
+
+    def get(self, path, params=None, base="url"):
+        for exchange in self.rest:
+            if exchange["request"] == dict(path=path, params=params, base=base):
+                if exchange["status"] == 404:
+                    return None
+                if exchange["status"] >= 400:
+                    raise EndpointError(f"all endpoints failed: {exchange['response']}")
+                return exchange["response"]
+        raise AssertionError(f"no recorded reply for {base} {path} {params}")
+
+
+def test_cosmos_found():
+    tm = CosmosTokenManager(FixturePool("cosmos"))
+    ibc = "ibc/27394FB092D2ECCD56123C74F36E4C1F926001CEADA9CA97EA622B25F41E5EB2"
+    infos = tm.get_tokens_info(["uosmo", "uion", ibc])
+    # metadata from both pages of denoms_metadata
+    assert infos["uosmo"] == ("Osmosis", "OSMO", 6)
+    assert infos["uion"] == ("Ion", "ION", 6)
+    # no metadata, but it has a supply
+    assert infos[ibc] == (None, None, None)
+
+
+def test_cosmos_missing():
+    tm = CosmosTokenManager(FixturePool("cosmos"))
+    denom = "factory/osmo1q77cw0mmlluxu0wr29fcdd0tdnh78gzhkvhe4n/gone"
+    assert isinstance(tm.get_tokens_info([denom])[denom], InvalidContractError)
+
+
+def test_cosmos_error():
+    pool = FixturePool("cosmos")
+    pool.rest[0]["status"] = 503
+    with pytest.raises(EndpointError):
+        CosmosTokenManager(pool).get_tokens_info(["uosmo"])
+
+
+def test_algo_found():
+    tm = AlgoTokenManager(FixturePool("algo"))
+    assert tm.get_tokens_info(["31566704"]) == {"31566704": ("USDC", "USDC", 6)}
+    assert tm.last_block == 38542113
+
+
+def test_algo_missing():
+    infos = AlgoTokenManager(FixturePool("algo")).get_tokens_info(["1234", "137594422"])
+    assert isinstance(infos["1234"], InvalidContractError)
+    # deleted assets are gone too
+    assert isinstance(infos["137594422"], InvalidContractError)
+
+
+def test_algo_error():
+    infos = AlgoTokenManager(FixturePool("algo")).get_tokens_info(["386192725", "31566704"])
+    assert isinstance(infos["386192725"], EndpointError)
+    assert infos["31566704"] == ("USDC", "USDC", 6)
+
+
+USDT = "cfx:acf2rcsh8payyxpg6xj7b0ztswwh81ute60tsw35j7"
+EOA = "cfx:aarc9abycue0hhzgyrr53m6cxedgccrmmyybjgh4xg"
+FLAKY = "cfx:acc7uawf5ubtnmezvhu9dhc6sghea0403y2dgpyfjp"
+
+
+def test_cfx_found():
+    tm = CfxTokenManager(FixturePool("cfx"))
+    assert tm.get_tokens_info([USDT]) == {USDT: ("Tether USD", "USDT", 18)}
+    assert tm.last_block == 100000000
+
+
+def test_cfx_found_without_symbol():
+    pool = FixturePool("cfx")
+    pool.rpc[2]["response"] = dict(
+        jsonrpc="2.0", error=dict(code=-32015, message="Transaction reverted", data="0x"))
+    # a revert is the contract's answer, not a failed lookup
+    assert CfxTokenManager(pool).get_tokens_info([USDT]) == {USDT: ("Tether USD", None, 18)}
+
+
+def test_cfx_missing():
+    infos = CfxTokenManager(FixturePool("cfx")).get_tokens_info([EOA, USDT])
+    assert isinstance(infos[EOA], InvalidContractError)
+    assert infos[USDT] == ("Tether USD", "USDT", 18)
+
+
+def test_cfx_error():
+    infos = CfxTokenManager(FixturePool("cfx")).get_tokens_info([FLAKY, USDT])
+    assert isinstance(infos[FLAKY], EndpointError)
+    assert infos[USDT] == ("Tether USD", "USDT", 18)
+
+
+def test_cfx_batch_rejected():
+    pool = FixturePool("cfx")
+    pool.batch_error = dict(jsonrpc="2.0", id=None,
+                            error=dict(code=-32600, message="batch too large"))
+    with pytest.raises(EndpointError):
+        CfxTokenManager(pool).get_tokens_info([USDT, EOA])
+
+
+def test_cfx_batch_split():
+    pool = FixturePool("cfx")
+    pool.max_batch = 5
+    infos = CfxTokenManager(pool).get_tokens_info([USDT, EOA])
+    # 9 calls refused, then halves of 4 and 5
+    assert pool.batches == [9, 4, 5]
+    assert infos[USDT] == ("Tether USD", "USDT", 18)
+    assert isinstance(infos[EOA], InvalidContractError)
+
+
+def test_evm_batch_size():
+    assert CfxTokenManager(FixturePool("cfx")).batch_size == 24
+    pool = FixturePool("cfx")
+    pool.batch_limit = 50
+    assert CfxTokenManager(pool).batch_size == 12
+
+
+STAR = "0x8c109349c6bd91411d6bc962e080c4a3::STAR::STAR"
+FAKE = "0x8c109349c6bd91411d6bc962e080c4a3::FAKE::FAKE"
+BUSY = "0x1::STC::STC"
+
+
+def test_stc_found():
+    tm = StcTokenManager(FixturePool("stc"))
+    assert tm.get_tokens_info([STAR]) == {STAR: (None, "STAR", 9)}
+    assert tm.last_block == 16253000
+
+
+def test_stc_missing():
+    infos = StcTokenManager(FixturePool("stc")).get_tokens_info([FAKE, STAR])
+    assert isinstance(infos[FAKE], InvalidContractError)
+    assert infos[STAR] == (None, "STAR", 9)
+
+
+def test_stc_error():
+    infos = StcTokenManager(FixturePool("stc")).get_tokens_info([BUSY, STAR])
+    assert isinstance(infos[BUSY], EndpointError)
+    assert infos[STAR] == (None, "STAR", 9)
+
+
+def test_near_found():
+    tm = NearTokenManager(FixturePool("near"))
+    assert tm.get_tokens_info(["wrap.near"]) == {
+        "wrap.near": ("Wrapped NEAR fungible token", "wNEAR", 24)}
+    assert tm.last_block == 112345678
+
+
+def test_near_missing():
+    infos = NearTokenManager(FixturePool("near")).get_tokens_info(
+        ["alice.near", "gone.near", "app.near"])
+    # an account without code, and one that does not exist
+    assert isinstance(infos["alice.near"], InvalidContractError)
+    assert isinstance(infos["gone.near"], InvalidContractError)
+    # a contract without ft_metadata
+    assert infos["app.near"] == (None, None, None)
+
+
+def test_near_error():
+    infos = NearTokenManager(FixturePool("near")).get_tokens_info(["busy.near", "wrap.near"])
+    assert isinstance(infos["busy.near"], EndpointError)
+    assert infos["wrap.near"] == ("Wrapped NEAR fungible token", "wNEAR", 24)